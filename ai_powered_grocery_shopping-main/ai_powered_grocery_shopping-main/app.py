@@ -1,28 +1,52 @@
 # -*- coding: utf-8 -*-
-from flask import Flask, request, render_template, redirect, url_for, session, flash, jsonify
+from flask import Flask, request, render_template, redirect, url_for, session, flash, jsonify, Response, stream_with_context
 from flask_pymongo import PyMongo
 from bson.objectid import ObjectId
+from bson import json_util
+from pymongo import ASCENDING, DESCENDING, ReturnDocument, UpdateOne
+from pymongo.errors import DuplicateKeyError
 import re
 import g4f
 import uuid
-from datetime import datetime
+import base64
+import hashlib
+from bisect import bisect_left
+import copy
+import json
+from collections import Counter, OrderedDict, namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
 import traceback
 import bcrypt  # For password hashing
 import os
-from functools import wraps  # For auth decorators
+import sys
+import threading
+import atexit
+import time
+from functools import lru_cache, wraps  # For auth decorators and memoization
+import units
 
 app = Flask(__name__)
 app.secret_key = os.urandom(24)
 
 # MongoDB config
 app.config["MONGO_URI"] = "mongodb://localhost:27017/ingredient_app"
+# "mongo" shares carts between workers; "memory" keeps them in this process (single worker / development)
+app.config["CART_STORE"] = os.environ.get("CART_STORE", "mongo")
 try:
     mongo = PyMongo(app)
     products_col = mongo.db.products
     suggestions_col = mongo.db.suggestions
+    unmatched_col = mongo.db.unmatched_ingredients  # One document per unmatched normalized ingredient name
     orders_col = mongo.db.orders
     users_col = mongo.db.users  # New collection for users
     recipes_col = mongo.db.recipes  # New collection for recipes
+    llm_cache_col = mongo.db.llm_cache  # Shared cache of generated recipes
+    recipe_jobs_col = mongo.db.recipe_jobs  # Background recipe job state, readable from any worker
+    catalog_meta_col = mongo.db.catalog_meta  # Version counters for shared in-memory catalogs
+    carts_col = mongo.db.carts  # Server-side carts, keyed by the session's cart_id
+    stock_reservations_col = mongo.db.stock_reservations  # Stock held by in-flight checkouts
+    sales_rollups_col = mongo.db.sales_rollups  # Hourly/daily sales totals for the admin dashboard
     # Test connection
     mongo.cx.server_info()
     print("MongoDB connection successful.")
@@ -95,7 +119,12 @@ def register():
             "is_admin": False  # Default to regular user
         }
         
-        users_col.insert_one(new_user)
+        try:
+            users_col.insert_one(new_user)
+        except DuplicateKeyError:
+            # Lost a race with another registration for the same username or email
+            flash("Username or email already exists", "danger")
+            return render_template("register.html")
         flash("Registration successful! Please login.", "success")
         return redirect(url_for("login"))
         
@@ -150,7 +179,7 @@ def dashboard():
         return redirect(url_for("login"))
     
     # Get user's orders
-    user_orders = list(orders_col.find({"user_id": user_id}).sort("order_date", -1))
+    user_orders = list(orders_col.find({"user_id": user_id}, ORDER_SUMMARY_FIELDS).sort("order_date", -1))
     
     return render_template("index.html", 
                           user=user,
@@ -212,6 +241,249 @@ def profile():
     
     return render_template("profile.html", user=user)
 
+# --- Pagination ---
+
+# Keyset order for product listings; (name, _id) is unique, so pages never overlap
+PRODUCT_SORT = [("name", ASCENDING), ("_id", ASCENDING)]
+PRODUCTS_PER_PAGE = 12
+HOME_PAGE_PRODUCTS = 8  # The home page shows a short featured grid
+MAX_API_PAGE_SIZE = 48
+# Only what a product card renders; descriptions, tags etc. stay in MongoDB
+PRODUCT_CARD_FIELDS = {"name": 1, "category": 1, "price_per_unit": 1, "unit": 1, "min_qty": 1, "image_url": 1}
+ORDER_SORT = [("order_date", DESCENDING), ("_id", DESCENDING)]
+# An order's summary fields; listings never ship the line items
+ORDER_SUMMARY_FIELDS = {"order_id": 1, "order_date": 1, "customer_name": 1, "customer_email": 1,
+                        "total": 1, "item_count": 1, "status": 1, "user_id": 1}
+USER_SORT = [("username", ASCENDING), ("_id", ASCENDING)]
+ORDERS_PER_PAGE = 25
+ADMIN_PER_PAGE = 25
+# Most frequently unmatched ingredients first
+UNMATCHED_SORT = [("count", DESCENDING), ("_id", ASCENDING)]
+UNMATCHED_PER_PAGE = 20
+
+def encode_page_token(data):
+    """Opaque, URL-safe token for a pagination position"""
+    return base64.urlsafe_b64encode(json_util.dumps(data).encode("utf-8")).decode("ascii")
+
+# Values a sort key can hold; anything else (an operator document, a list) is a tampered token
+PAGE_KEY_TYPES = (str, int, float, bool, type(None), ObjectId, datetime)
+
+def decode_page_token(token):
+    """Inverse of encode_page_token; None for a missing or tampered token.
+
+    Keys go straight into query filters, so only plain values are
+    accepted: "k" must be a list of PAGE_KEY_TYPES and "o" a
+    non-negative int.
+    """
+    if not token:
+        return None
+    try:
+        data = json_util.loads(base64.urlsafe_b64decode(token.encode("ascii")))
+    except Exception:
+        return None
+    if not isinstance(data, dict):
+        return None
+    if "k" in data and not (isinstance(data["k"], list) and all(isinstance(key, PAGE_KEY_TYPES) for key in data["k"])):
+        return None
+    if "o" in data and not (isinstance(data["o"], int) and not isinstance(data["o"], bool) and data["o"] >= 0):
+        return None
+    return data
+
+def keyset_paginate(collection, query, sort, token=None, per_page=12, projection=None):
+    """Fetch one page ordered by sort (a list of (field, direction) ending in _id).
+
+    Instead of skip(), each page continues from the sort key of the last
+    (or first) document of the previous page, so every page costs one
+    index range scan no matter how deep it is.
+    Returns (documents, next_token, prev_token).
+    """
+    position = decode_page_token(token)
+    backwards = bool(position and position.get("d") == "prev")
+    fields = [field for field, _ in sort]
+
+    conditions = [query] if query else []
+    if position and len(position.get("k", [])) == len(fields):
+        # (f1 > v1) or (f1 == v1 and f2 > v2) or ... respecting each field's direction
+        keys = position["k"]
+        branches = []
+        for i, (field, direction) in enumerate(sort):
+            ascending = (direction == ASCENDING) != backwards
+            branch = {fields[j]: keys[j] for j in range(i)}
+            branch[field] = {"$gt" if ascending else "$lt": keys[i]}
+            branches.append(branch)
+        conditions.append({"$or": branches})
+
+    if not conditions:
+        page_query = {}
+    elif len(conditions) == 1:
+        page_query = conditions[0]
+    else:
+        page_query = {"$and": conditions}
+
+    cursor_sort = [(field, -direction if backwards else direction) for field, direction in sort]
+    documents = list(collection.find(page_query, projection).sort(cursor_sort).limit(per_page + 1))
+    has_more = len(documents) > per_page
+    documents = documents[:per_page]
+    if backwards:
+        documents.reverse()
+
+    def token_for(document, direction):
+        return encode_page_token({"k": [document.get(field) for field in fields], "d": direction})
+
+    next_token = prev_token = None
+    if documents:
+        if has_more or backwards:
+            next_token = token_for(documents[-1], "next")
+        if (has_more and backwards) or (position and not backwards):
+            prev_token = token_for(documents[0], "prev")
+    return documents, next_token, prev_token
+
+def paginate_list(items, token=None, per_page=12):
+    """Page through an already ranked in-memory list with the same tokens"""
+    position = decode_page_token(token)
+    offset = position.get("o", 0) if position else 0
+    page = items[offset:offset + per_page]
+    next_token = encode_page_token({"o": offset + per_page}) if offset + per_page < len(items) else None
+    prev_token = encode_page_token({"o": max(offset - per_page, 0)}) if offset > 0 else None
+    return page, next_token, prev_token
+
+_count_cache = {}
+COUNT_CACHE_TTL = 60  # seconds
+
+def cached_count(collection, query):
+    """Document count for a listing, cached briefly; uses collection metadata when unfiltered"""
+    if not query:
+        return collection.estimated_document_count()
+
+    key = (collection.name, json_util.dumps(query, sort_keys=True))
+    cached = _count_cache.get(key)
+    if cached and cached[1] > time.time():
+        return cached[0]
+
+    count = collection.count_documents(query)
+    if len(_count_cache) > 1024:
+        _count_cache.clear()
+    _count_cache[key] = (count, time.time() + COUNT_CACHE_TTL)
+    return count
+
+def fetch_product_cards(search_query="", category="", token=None, per_page=HOME_PAGE_PRODUCTS):
+    """One page of product cards for the home grid and /api/products"""
+    if search_query:
+        # Search results already live in memory; just trim them to the card fields
+        matches, next_token, prev_token = paginate_list(
+            product_index.search(search_query, category), token, per_page)
+        products = [{field: product.get(field) for field in ("_id", *PRODUCT_CARD_FIELDS)} for product in matches]
+        return products, next_token, prev_token
+
+    products_query = {}
+    if category:
+        products_query["category"] = category
+    return keyset_paginate(products_col, products_query, PRODUCT_SORT, token, per_page,
+                           projection=PRODUCT_CARD_FIELDS)
+
+# --- Write-behind buffers ---
+
+class WriteBehindBuffer:
+    """Collects documents in memory and writes them in batches on a background thread.
+
+    A batch is flushed once max_batch items are pending or the oldest has
+    waited max_delay seconds. At most max_pending items are held: add()
+    then waits up to put_timeout for the writer to catch up and drops the
+    item if it can't, so a slow database holds up requests by a bounded
+    amount and never grows memory without limit. close() (registered
+    with atexit) flushes whatever is left.
+    """
+
+    def __init__(self, name, write, max_batch=500, max_delay=2.0, max_pending=10000, put_timeout=0.05):
+        self.name = name
+        self._write = write
+        self._max_batch = max_batch
+        self._max_delay = max_delay
+        self._max_pending = max_pending
+        self._put_timeout = put_timeout
+        self._pending = []
+        self._oldest = None
+        self._closed = False
+        self._thread = None
+        self._cond = threading.Condition()
+        self._stats = {"written": 0, "dropped": 0, "failed": 0, "flushes": 0}
+
+    def add(self, item):
+        """Queue an item; False if it was dropped because the buffer stayed full"""
+        with self._cond:
+            if self._closed:
+                direct = True
+            else:
+                direct = False
+                if self._thread is None:
+                    self._thread = threading.Thread(target=self._run, name=f"write-behind-{self.name}", daemon=True)
+                    self._thread.start()
+                deadline = time.monotonic() + self._put_timeout
+                while len(self._pending) >= self._max_pending:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        self._stats["dropped"] += 1
+                        return False
+                    self._cond.wait(remaining)
+                if not self._pending:
+                    self._oldest = time.monotonic()
+                self._pending.append(item)
+                if len(self._pending) >= self._max_batch:
+                    self._cond.notify_all()
+        if direct:
+            # Shutting down: nothing will flush later, so write now
+            self._flush([item])
+        return True
+
+    def _next_batch(self):
+        with self._cond:
+            while not self._closed and len(self._pending) < self._max_batch:
+                if self._pending:
+                    remaining = self._oldest + self._max_delay - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._cond.wait(remaining)
+                else:
+                    self._cond.wait()
+            batch = self._pending[:self._max_batch]
+            del self._pending[:self._max_batch]
+            self._oldest = time.monotonic() if self._pending else None
+            # Wake producers waiting for room
+            self._cond.notify_all()
+            return batch
+
+    def _run(self):
+        while True:
+            batch = self._next_batch()
+            if batch:
+                self._flush(batch)
+            elif self._closed:
+                return
+
+    def _flush(self, batch):
+        try:
+            self._write(batch)
+            with self._cond:
+                self._stats["written"] += len(batch)
+                self._stats["flushes"] += 1
+        except Exception as e:
+            print(f"Error flushing {len(batch)} {self.name} writes: {e}")
+            with self._cond:
+                self._stats["failed"] += len(batch)
+
+    def close(self, timeout=10):
+        """Stop taking new work and flush everything pending"""
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+            thread = self._thread
+        if thread is not None:
+            thread.join(timeout)
+
+    def get_stats(self):
+        with self._cond:
+            return dict(self._stats, pending=len(self._pending))
+
 # --- Enhanced home page with product listing and search ---
 
 @app.route("/", methods=["GET", "POST"])
@@ -224,27 +496,15 @@ def index():
     error_message = None
     
     # Define common dietary preferences
-    dietary_options = [
-        "Vegetarian",
-        "Vegan",
-        "Gluten-Free",
-        "Dairy-Free",
-        "Keto",
-        "Paleo",
-        "Low-Carb",
-        "Nut-Free"
-    ]
+    dietary_options = DEFAULT_DIETARY_TAGS
     
     # For product search
     search_query = request.args.get("search", "")
     category = request.args.get("category", "")
+    page_token = request.args.get("cursor")
     
     # Get available product categories
-    try:
-        categories = products_col.distinct("category")
-    except Exception as e:
-        print(f"Error fetching categories: {e}")
-        categories = []
+    categories = facet_cache.categories()
     
     if request.method == "POST":
         dish_name = request.form.get("dish_name", "").strip()
@@ -252,6 +512,9 @@ def index():
         # Get selected dietary preferences
         dietary_preferences = request.form.getlist("dietary_preferences")
 
+        if request.form.get("async"):
+            return submit_recipe_job(dish_name, servings, dietary_preferences)
+
         if not dish_name:
             flash("Please enter a dish name.", "warning")
         elif not servings:
@@ -263,80 +526,25 @@ def index():
                 flash(error_message, "danger")
 
             if isinstance(ingredients, list):
+                matched_products, unmatched = match_recipe_products(
+                    ingredients, url_for('static', filename='images/default.png'))
+
                 # Store suggestion if user is logged in
                 if "user_id" in session:
-                    try:
-                        suggestions_col.insert_one({
-                            "user_id": session["user_id"],
-                            "dish_name": dish_name,
-                            "servings": int(servings),
-                            "dietary_preferences": dietary_preferences,
-                            "ingredients": ingredients,
-                            "instructions": instructions,
-                            "timestamp": datetime.now()
-                        })
-                    except Exception as e:
-                        print(f"Error saving suggestion to DB: {e}")
-                
-                # Match ingredients to products
-                for ing in ingredients:
-                    ingredient_name = ing["name"]
-                    ingredient_quantity = ing["quantity"]
-                    ingredient_name_norm = normalize_ingredient_name(ingredient_name)
-
-                    # Find matching product
-                    product = find_matching_product(ingredient_name_norm)
-                    
-                    if product:
-                        product_name_db = product.get("name", "N/A")
-                        image_url_db = product.get("image_url", url_for('static', filename='images/default.png'))
-                        price = calculate_price(product_name_db, ingredient_quantity)
-
-                        matched_products.append({
-                            "ingredient_name": ingredient_name,
-                            "quantity": ingredient_quantity,
-                            "product_name": product_name_db,
-                            "image_url": image_url_db,
-                            "price": price,
-                            "product_id": str(product["_id"])
-                        })
-                    else:
-                        # Log unmatched ingredient
-                        print(f"No match found for ingredient: '{ingredient_name}'")
-                        if "user_id" in session:
-                            try:
-                                suggestions_col.insert_one({
-                                    "user_id": session["user_id"],
-                                    "ingredient_name": ingredient_name,
-                                    "normalized_name": ingredient_name_norm,
-                                    "quantity": ingredient_quantity,
-                                    "dish": dish_name,
-                                    "status": "unmatched",
-                                    "timestamp": datetime.now()
-                                })
-                            except Exception as e:
-                                print(f"Error saving unmatched suggestion: {e}")
-
-    # Get products based on search/filter or just get all
-    try:
-        products_query = {}
-        
-        if search_query:
-            # Search in name, description, and tags
-            products_query["$or"] = [
-                {"name": {"$regex": search_query, "$options": "i"}},
-                {"description": {"$regex": search_query, "$options": "i"}},
-                {"tags": {"$regex": search_query, "$options": "i"}}
-            ]
-            
-        if category:
-            products_query["category"] = category
-            
-        all_products = list(products_col.find(products_query).sort("name", 1))
-    except Exception as e:
-        print(f"Error fetching products: {e}")
-        flash("Could not load product list.", "danger")
-        all_products = []
+                    record_recipe_suggestion(session["user_id"], dish_name, servings, dietary_preferences,
+                                             ingredients, instructions, unmatched)
+
+    # Get one page of products based on search/filter. A recipe submission
+    # doesn't need the grid at all; the page fetches it from /api/products.
+    all_products = []
+    next_token = None
+    lazy_products = request.method == "POST"
+    if not lazy_products:
+        try:
+            all_products, next_token, _ = fetch_product_cards(search_query, category, page_token)
+        except Exception as e:
+            print(f"Error fetching products: {e}")
+            flash("Could not load product list.", "danger")
 
     return render_template("index.html",
                            ingredients=ingredients,
@@ -348,33 +556,753 @@ def index():
                            categories=categories,
                            search_query=search_query,
                            current_category=category,
+                           next_cursor=next_token,
+                           lazy_products=lazy_products,
                            error_message=error_message,
                            dietary_options=dietary_options)
 
-def find_matching_product(ingredient_name_norm):
-    """Find matching product using multiple methods"""
-    # Direct match by normalized name
-    product = products_col.find_one({"name_normalized": ingredient_name_norm})
-    if product:
-        return product
-        
-    # Try synonym lookup
-    for key, synonyms in INGREDIENT_SYNONYMS.items():
-        if ingredient_name_norm == key or ingredient_name_norm in synonyms:
-            canonical_name = key
-            product = products_col.find_one({"name_normalized": canonical_name})
+def match_recipe_products(ingredients, default_image_url):
+    """Match generated ingredients to products.
+
+    Returns (matched_products, unmatched) where unmatched lists the
+    ingredients no product was found for.
+    """
+    matched_products = []
+    unmatched = []
+
+    # Match ingredients to products against one index snapshot
+    resolved = resolve_ingredients([ing["name"] for ing in ingredients])
+
+    for ing, (ingredient_name_norm, product) in zip(ingredients, resolved):
+        ingredient_name = ing["name"]
+        ingredient_quantity = ing["quantity"]
+
+        if product:
+            product_name_db = product.get("name", "N/A")
+            image_url_db = product.get("image_url", default_image_url)
+
+            matched_products.append({
+                "ingredient_name": ingredient_name,
+                "quantity": ingredient_quantity,
+                "product_name": product_name_db,
+                "image_url": image_url_db,
+                "product_id": str(product["_id"])
+            })
+        else:
+            print(f"No match found for ingredient: '{ingredient_name}'")
+            unmatched.append({
+                "ingredient_name": ingredient_name,
+                "normalized_name": ingredient_name_norm,
+                "quantity": ingredient_quantity
+            })
+
+    # Price every match in one batch
+    prices = price_many((match["product_name"], match["quantity"]) for match in matched_products)
+    for match, price in zip(matched_products, prices):
+        match["price"] = price
+
+    return matched_products, unmatched
+
+def record_recipe_suggestion(user_id, dish_name, servings, dietary_preferences, ingredients, instructions, unmatched):
+    """Queue a generated recipe and its unmatched ingredients for a user to be written in the background"""
+    try:
+        suggestion_writes.add({
+            "user_id": user_id,
+            "dish_name": dish_name,
+            "servings": int(servings),
+            "dietary_preferences": dietary_preferences,
+            "ingredients": ingredients,
+            "instructions": instructions,
+            "timestamp": datetime.now()
+        })
+    except Exception as e:
+        print(f"Error queueing suggestion: {e}")
+
+    if unmatched:
+        unmatched_writes.add((unmatched, dish_name, datetime.now()))
+
+UNMATCHED_SAMPLE_DISHES = 5
+
+def write_unmatched_ingredients(batches):
+    """Count (unmatched, dish_name, seen_at) batches into their per-name documents with one bulk write.
+
+    Each normalized name keeps a running count, first and last seen
+    times, the latest raw name and quantity, and up to
+    UNMATCHED_SAMPLE_DISHES distinct dishes it was asked for in.
+    """
+    merged = {}
+    for unmatched, dish_name, seen_at in batches:
+        for item in unmatched:
+            name = item.get("normalized_name")
+            if not name:
+                continue
+            entry = merged.setdefault(name, {"count": 0, "dishes": [], "first_seen": seen_at, "last_seen": seen_at})
+            entry["count"] += 1
+            entry["ingredient_name"] = item["ingredient_name"]
+            entry["quantity"] = item["quantity"]
+            entry["first_seen"] = min(entry["first_seen"], seen_at)
+            entry["last_seen"] = max(entry["last_seen"], seen_at)
+            if dish_name and dish_name not in entry["dishes"]:
+                entry["dishes"].append(dish_name)
+    if not merged:
+        return
+
+    unmatched_col.bulk_write([
+        UpdateOne({"_id": name}, [{"$set": {
+            "ingredient_name": entry["ingredient_name"],
+            "sample_quantity": entry["quantity"],
+            "count": {"$add": [{"$ifNull": ["$count", 0]}, entry["count"]]},
+            # $min/$max ignore a missing field, so a new document takes this batch's times
+            "first_seen": {"$min": ["$first_seen", entry["first_seen"]]},
+            "last_seen": {"$max": ["$last_seen", entry["last_seen"]]},
+            "sample_dishes": {"$slice": [{"$setUnion": [{"$ifNull": ["$sample_dishes", []]}, entry["dishes"]]},
+                                         UNMATCHED_SAMPLE_DISHES]}
+        }}], upsert=True)
+        for name, entry in merged.items()
+    ], ordered=False)
+
+suggestion_writes = WriteBehindBuffer(
+    "suggestion", lambda documents: suggestions_col.insert_many(documents, ordered=False))
+# Unmatched ingredients are coalesced per name, so one flush is one bulk upsert per distinct name
+unmatched_writes = WriteBehindBuffer("unmatched ingredient", write_unmatched_ingredients)
+atexit.register(suggestion_writes.close)
+atexit.register(unmatched_writes.close)
+
+def migrate_unmatched_suggestions():
+    """Fold the per-request unmatched rows older versions wrote to suggestions into unmatched_ingredients.
+
+    Runs server-side with $group/$merge, and only while the new collection
+    is still empty. The old rows are left in place.
+    """
+    if unmatched_col.estimated_document_count() or not suggestions_col.find_one({"status": "unmatched"}, {"_id": 1}):
+        return
+    suggestions_col.aggregate([
+        {"$match": {"status": "unmatched", "normalized_name": {"$nin": [None, ""]}}},
+        {"$sort": {"timestamp": ASCENDING}},
+        {"$group": {
+            "_id": "$normalized_name",
+            "ingredient_name": {"$last": "$ingredient_name"},
+            "sample_quantity": {"$last": "$quantity"},
+            "count": {"$sum": 1},
+            "first_seen": {"$min": "$timestamp"},
+            "last_seen": {"$max": "$timestamp"},
+            "dishes": {"$addToSet": "$dish"}
+        }},
+        {"$set": {"sample_dishes": {"$slice": [{"$setDifference": ["$dishes", [None, ""]]}, UNMATCHED_SAMPLE_DISHES]}}},
+        {"$unset": "dishes"},
+        {"$merge": {"into": unmatched_col.name, "whenMatched": "keepExisting"}}
+    ])
+    print(f"Migrated unmatched suggestions: {unmatched_col.estimated_document_count()} ingredients")
+
+def resolve_ingredients(names, fuzzy=True):
+    """Resolve a whole ingredient list to products from the in-memory product index.
+
+    Returns a list of (normalized_name, product) pairs in the order of
+    ``names``; product is None when nothing matched. Each name is looked
+    up by exact normalized name, then by synonym, and only when ``fuzzy``
+    is set by substring of the product name.
+    """
+    return product_index.resolve([normalize_ingredient_name(name) for name in names], fuzzy)
+
+# --- In-memory product index ---
+
+# Fields searched by ProductIndex.search() and how much a hit in each counts
+SEARCH_FIELD_WEIGHTS = (("name", 3.0), ("tags", 2.0), ("description", 1.0))
+SEARCH_TOKEN_RE = re.compile(r'[^\W_]+')
+
+def tokenize_search_text(text):
+    """Lowercase word tokens of a search query or product field"""
+    if isinstance(text, (list, tuple)):
+        text = " ".join(str(value) for value in text)
+    return SEARCH_TOKEN_RE.findall(str(text).lower()) if text else []
+
+ProductIndexState = namedtuple("ProductIndexState", [
+    "products", "by_normalized", "lowered_names", "trigrams", "postings", "vocabulary", "sorted_names",
+    "categories"
+])
+
+def read_catalog_version(meta):
+    """Current product catalog version, bumped by every product write"""
+    doc = meta.find_one({"_id": "pricing"})
+    return doc.get("version", 0) if doc else 0
+
+class ProductIndex:
+    """Process-local copy of the products collection for matching and search.
+
+    Answers the three lookups ingredient matching used to send to
+    MongoDB -- exact normalized name, synonym, then a case-insensitive
+    substring of the product name -- without any database round trips.
+    Substring candidates come from a trigram index and are checked in
+    collection order, so the first hit is the one find_one would return.
+
+    It also holds an inverted index over product names, tags and
+    descriptions for search(), with prefix matching on every query word.
+    """
+
+    # Product writes bump the catalog_meta version; it is checked at most
+    # every POLL_INTERVAL seconds so other workers' writes are picked up.
+    # Local writes call invalidate() directly. MAX_AGE is only a backstop
+    # for writes that don't bump the version, such as stock counts.
+    POLL_INTERVAL = 5
+    MAX_AGE = 3600
+
+    EMPTY_STATE = ProductIndexState([], {}, [], {}, {}, [], [], [])
+
+    def __init__(self, collection, meta=None, poll_interval=POLL_INTERVAL, max_age=MAX_AGE):
+        self._collection = collection
+        self._meta = meta
+        self._poll_interval = poll_interval
+        self._max_age = max_age
+        self._lock = threading.Lock()
+        self._state = None
+        self._loaded_at = 0.0
+        self._stale = True
+        self._version = None
+        self._next_poll = 0
+
+    def invalidate(self):
+        """Mark the index stale so the next lookup reloads the products"""
+        self._stale = True
+
+    def _poll(self):
+        """Mark the index stale if the catalog version moved since the last check"""
+        self._next_poll = time.time() + self._poll_interval
+        try:
+            version = read_catalog_version(self._meta)
+        except Exception as e:
+            print(f"Error reading catalog version: {e}")
+            return
+        if version != self._version:
+            self._version = version
+            self._stale = True
+
+    def _needs_refresh(self):
+        return self._stale or time.time() - self._loaded_at > self._max_age
+
+    def _snapshot(self):
+        if self._meta is not None and time.time() >= self._next_poll:
+            self._poll()
+        if self._needs_refresh():
+            with self._lock:
+                if self._needs_refresh():
+                    try:
+                        self._stale = False
+                        self._state = self._build(list(self._collection.find()))
+                        self._loaded_at = time.time()
+                    except Exception as e:
+                        self._stale = True
+                        print(f"Error building product index: {e}")
+        return self._state or self.EMPTY_STATE
+
+    @staticmethod
+    def _build(products):
+        by_normalized = {}
+        lowered_names = []
+        trigrams = {}
+        postings = {}
+        for position, product in enumerate(products):
+            name_normalized = product.get("name_normalized")
+            if isinstance(name_normalized, str):
+                by_normalized.setdefault(name_normalized, product)
+
+            name = product.get("name")
+            name = name.lower() if isinstance(name, str) else None
+            lowered_names.append(name)
+            if name:
+                for i in range(len(name) - 2):
+                    trigrams.setdefault(name[i:i + 3], set()).add(position)
+
+            # Weight of each token in this product, counting each field once
+            weights = {}
+            for field, weight in SEARCH_FIELD_WEIGHTS:
+                for token in set(tokenize_search_text(product.get(field))):
+                    weights[token] = weights.get(token, 0.0) + weight
+            for token, weight in weights.items():
+                postings.setdefault(token, {})[position] = weight
+
+        sorted_names = sorted((name, position) for position, name in enumerate(lowered_names) if name)
+        categories = [product.get("category") for product in products]
+        return ProductIndexState(products, by_normalized, lowered_names, trigrams,
+                                 postings, sorted(postings), sorted_names, categories)
+
+    @staticmethod
+    def _substring_match(state, ingredient_name_norm):
+        products, lowered_names, trigrams = state.products, state.lowered_names, state.trigrams
+        if len(ingredient_name_norm) < 3:
+            candidates = range(len(products))
+        else:
+            postings = []
+            for i in range(len(ingredient_name_norm) - 2):
+                posting = trigrams.get(ingredient_name_norm[i:i + 3])
+                if not posting:
+                    return None
+                postings.append(posting)
+            postings.sort(key=len)
+            candidates = sorted(postings[0].intersection(*postings[1:]))
+
+        for position in candidates:
+            name = lowered_names[position]
+            if name is not None and ingredient_name_norm in name:
+                return products[position]
+        return None
+
+    def _match(self, state, ingredient_name_norm, fuzzy=True):
+        by_normalized = state.by_normalized
+
+        # Direct match by normalized name
+        product = by_normalized.get(ingredient_name_norm)
+        if product:
+            return product
+
+        # Try synonym lookup
+        for key in SYNONYM_TO_CANONICAL.get(ingredient_name_norm, ()):
+            product = by_normalized.get(key)
             if product:
                 return product
-    
-    # Fuzzy match with regex
-    safe_name_pattern = re.escape(ingredient_name_norm)
-    product = products_col.find_one({
-        "name": re.compile(f".*{safe_name_pattern}.*", re.IGNORECASE)
-    })
-    if product:
-        return product
-        
-    return None
+
+        # Fuzzy match on the product name
+        return self._substring_match(state, ingredient_name_norm) if fuzzy else None
+
+    def resolve(self, ingredient_names_norm, fuzzy=True):
+        """(name, product or None) for each normalized name, all against a single index snapshot"""
+        state = self._snapshot()
+        return [(name, self._match(state, name, fuzzy)) for name in ingredient_names_norm]
+
+    @staticmethod
+    def _term_scores(state, term):
+        """Score of every product containing a word that starts with term"""
+        vocabulary = state.vocabulary
+        start = bisect_left(vocabulary, term)
+        end = start
+        while end < len(vocabulary) and vocabulary[end].startswith(term):
+            end += 1
+        if start == end:
+            return {}
+
+        # Whole-word hits count fully, prefix hits half
+        exact = vocabulary[start] == term
+        if exact:
+            scores = dict(state.postings[term])
+            start += 1
+        else:
+            scores = {position: weight * 0.5 for position, weight in state.postings[vocabulary[start]].items()}
+            start += 1
+        for token in vocabulary[start:end]:
+            for position, weight in state.postings[token].items():
+                score = weight * 0.5
+                if score > scores.get(position, 0.0):
+                    scores[position] = score
+        return scores
+
+    @staticmethod
+    def _names_starting_with(state, prefix):
+        sorted_names = state.sorted_names
+        i = bisect_left(sorted_names, (prefix,))
+        while i < len(sorted_names) and sorted_names[i][0].startswith(prefix):
+            yield sorted_names[i][1]
+            i += 1
+
+    def search(self, query, category=None, limit=None):
+        """Products matching every word of query (as a word prefix), best first.
+
+        Name hits outrank tag hits, which outrank description hits; ties
+        are ordered by product name.
+        """
+        state = self._snapshot()
+        terms = sorted(set(tokenize_search_text(query)), key=len, reverse=True)
+        if not terms:
+            return []
+
+        # Longest (usually most selective) term first keeps the intersection small
+        scores = None
+        for term in terms:
+            term_scores = self._term_scores(state, term)
+            if scores is None:
+                scores = term_scores
+            else:
+                scores = {position: scores[position] + score
+                          for position, score in term_scores.items() if position in scores}
+            if not scores:
+                return []
+
+        products, lowered_names, categories = state.products, state.lowered_names, state.categories
+        if category:
+            scores = {position: score for position, score in scores.items()
+                      if categories[position] == category}
+
+        # Names that start with the whole query go first
+        for position in self._names_starting_with(state, " ".join(tokenize_search_text(query))):
+            if position in scores:
+                scores[position] += 1.0
+
+        # Only products scoring at least the limit-th best score can make the cut
+        candidates = scores
+        if limit is not None and len(scores) > limit:
+            seen = 0
+            for threshold, count in sorted(Counter(scores.values()).items(), reverse=True):
+                seen += count
+                if seen >= limit:
+                    break
+            candidates = [position for position, score in scores.items() if score >= threshold]
+
+        ranked = sorted(candidates, key=lambda position: (-scores[position], lowered_names[position] or "", position))
+        if limit is not None:
+            ranked = ranked[:limit]
+        return [products[position] for position in ranked]
+
+product_index = ProductIndex(products_col, catalog_meta_col)
+
+# --- Facets ---
+
+DEFAULT_DIETARY_TAGS = ["Vegetarian", "Vegan", "Gluten-Free", "Dairy-Free", "Keto", "Paleo", "Low-Carb", "Nut-Free"]
+
+class FacetCache:
+    """Category counts and dietary tags for filter sidebars.
+
+    Each collection is summarised by a single $group aggregation and the
+    result is held in memory for ttl_seconds, so rendering a sidebar costs
+    no database round trip. Admin product writes call invalidate().
+    """
+
+    def __init__(self, products, recipes, ttl_seconds=300):
+        self._products = products
+        self._recipes = recipes
+        self._ttl = ttl_seconds
+        self._facets = None
+        self._expires_at = 0
+        self._lock = threading.Lock()
+
+    def invalidate(self):
+        with self._lock:
+            self._expires_at = 0
+
+    @staticmethod
+    def _group_counts(collection, pipeline):
+        return [(row["_id"], row["count"]) for row in collection.aggregate(pipeline) if row["_id"] not in (None, "")]
+
+    def _compute(self):
+        category_counts = self._group_counts(self._products, [
+            {"$group": {"_id": "$category", "count": {"$sum": 1}}},
+            {"$sort": {"_id": 1}},
+        ])
+        dietary_counts = self._group_counts(self._recipes, [
+            {"$unwind": "$dietary_tags"},
+            {"$group": {"_id": "$dietary_tags", "count": {"$sum": 1}}},
+            {"$sort": {"_id": 1}},
+        ])
+        return {
+            "categories": [name for name, _ in category_counts],
+            "category_counts": dict(category_counts),
+            "dietary_tags": [name for name, _ in dietary_counts],
+            "dietary_counts": dict(dietary_counts),
+        }
+
+    def get(self):
+        """Current facets, recomputed at most once per TTL"""
+        if time.time() < self._expires_at:
+            return self._facets
+        with self._lock:
+            if time.time() >= self._expires_at:
+                try:
+                    self._facets = self._compute()
+                    self._expires_at = time.time() + self._ttl
+                except Exception as e:
+                    print(f"Error computing facets: {e}")
+                    if self._facets is None:
+                        return {"categories": [], "category_counts": {}, "dietary_tags": [], "dietary_counts": {}}
+            return self._facets
+
+    def categories(self):
+        return self.get()["categories"]
+
+    def category_counts(self):
+        return self.get()["category_counts"]
+
+    def dietary_tags(self):
+        return self.get()["dietary_tags"]
+
+facet_cache = FacetCache(products_col, recipes_col)
+
+# --- Cart storage ---
+
+UUID_RE = re.compile(r'[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12}')
+
+def is_uuid(value):
+    return isinstance(value, str) and UUID_RE.fullmatch(value) is not None
+
+def valid_cart_item_id(item_id):
+    """Item IDs become field names in the cart document, so only accept UUIDs"""
+    return is_uuid(item_id)
+
+def cart_product_key(product_id, product_name):
+    """Key identifying "the same product" in a cart: its ID, or a digest of the name when it has none"""
+    if product_id:
+        return str(product_id)
+    return "name-" + hashlib.sha1(product_name.encode("utf-8")).hexdigest()
+
+class MongoCartStore:
+    """Carts in the carts collection, one document per cart ID.
+
+    Items live in a sub-document keyed by item ID, with a second map from
+    product key to item ID, so every lookup is by key and adding, updating
+    or removing one item is a single atomic update. The item count and the
+    total are kept up to date with $inc, so reading a cart never sums it.
+    The session cookie only carries the cart ID.
+    """
+
+    RETRIES = 3
+
+    def __init__(self, collection):
+        self._collection = collection
+
+    def get(self, cart_id):
+        """(items, total) for a cart"""
+        cart = self._collection.find_one({"_id": cart_id}, {"items": 1, "total": 1})
+        if not cart:
+            return [], 0
+        return list(cart.get("items", {}).values()), round(cart.get("total", 0), 2)
+
+    def count(self, cart_id):
+        cart = self._collection.find_one({"_id": cart_id}, {"item_count": 1})
+        return cart.get("item_count", 0) if cart else 0
+
+    def get_item(self, cart_id, item_id):
+        if not valid_cart_item_id(item_id):
+            return None
+        cart = self._collection.find_one({"_id": cart_id}, {f"items.{item_id}": 1})
+        return (cart or {}).get("items", {}).get(item_id)
+
+    def find_product_item(self, cart_id, product_key):
+        """The cart's item for a product, if any"""
+        cart = self._collection.find_one({"_id": cart_id}, {f"products.{product_key}": 1})
+        item_id = (cart or {}).get("products", {}).get(product_key)
+        return self.get_item(cart_id, item_id) if item_id else None
+
+    def _add_update(self, item, product_key=None):
+        fields = {f"items.{item['id']}": item, "updated_at": datetime.now()}
+        if product_key is not None:
+            fields[f"products.{product_key}"] = item["id"]
+        return {"$set": fields, "$inc": {"item_count": 1, "total": item.get("price", 0)}}
+
+    def add_item(self, cart_id, item):
+        """Add item as a line of its own; it becomes the product's line only if the cart has none"""
+        product_key = cart_product_key(item.get("product_id"), item["product_name"])
+        self._collection.update_one({"_id": cart_id}, self._add_update(item), upsert=True)
+        self._collection.update_one({"_id": cart_id, f"products.{product_key}": {"$exists": False}},
+                                    {"$set": {f"products.{product_key}": item["id"]}})
+
+    def _apply_changes(self, cart_id, item, changes):
+        """Set fields on item if it is still exactly as read, adjusting the total; False if it changed"""
+        item_id = item["id"]
+        fields = {f"items.{item_id}.{key}": value for key, value in changes.items()}
+        fields["updated_at"] = datetime.now()
+        price_delta = changes.get("price", item.get("price", 0)) - item.get("price", 0)
+        # Only apply if the quantity and price the change was computed from are still current
+        result = self._collection.update_one(
+            {"_id": cart_id, f"items.{item_id}.price": item.get("price"),
+             f"items.{item_id}.quantity": item.get("quantity")},
+            {"$set": fields, "$inc": {"total": price_delta}}
+        )
+        return result.matched_count == 1
+
+    def update_item(self, cart_id, item_id, changes):
+        """Set fields on one item, adjusting the total; False if the cart has no such item"""
+        for _ in range(self.RETRIES):
+            item = self.get_item(cart_id, item_id)
+            if item is None:
+                return False
+            if self._apply_changes(cart_id, item, changes):
+                return True
+        return False
+
+    def add_or_merge(self, cart_id, item, merge):
+        """Add item, or merge it into the cart's line for the same product.
+
+        The add only applies while the cart has no line for the product,
+        so two concurrent adds can't both create one. Otherwise
+        merge(existing, item) returns the changes for the existing line
+        (None adds item as a line of its own), applied only if that line
+        is unchanged since it was read. Returns the merged line, or None
+        if item was added.
+        """
+        product_key = cart_product_key(item.get("product_id"), item["product_name"])
+        for _ in range(self.RETRIES):
+            try:
+                self._collection.update_one({"_id": cart_id, f"products.{product_key}": {"$exists": False}},
+                                            self._add_update(item, product_key), upsert=True)
+                return None
+            except DuplicateKeyError:
+                pass  # The cart already has a line for this product
+            existing = self.find_product_item(cart_id, product_key)
+            if existing is None:
+                continue
+            changes = merge(existing, item)
+            if changes is None:
+                self.add_item(cart_id, item)
+                return None
+            if self._apply_changes(cart_id, existing, changes):
+                return existing
+        raise RuntimeError("The cart changed too often to add this item; please try again")
+
+    def remove_item(self, cart_id, item_id):
+        """Remove one item; False if the cart has no such item"""
+        for _ in range(self.RETRIES):
+            item = self.get_item(cart_id, item_id)
+            if item is None:
+                return False
+            product_key = cart_product_key(item.get("product_id"), item["product_name"])
+            result = self._collection.update_one(
+                {"_id": cart_id, f"items.{item_id}.price": item.get("price")},
+                {"$unset": {f"items.{item_id}": ""},
+                 "$inc": {"item_count": -1, "total": -item.get("price", 0)},
+                 "$set": {"updated_at": datetime.now()}}
+            )
+            if result.modified_count:
+                unmapped = self._collection.update_one({"_id": cart_id, f"products.{product_key}": item_id},
+                                                       {"$unset": {f"products.{product_key}": ""}})
+                if unmapped.modified_count:
+                    self._remap_product(cart_id, product_key)
+                return True
+        return False
+
+    def _remap_product(self, cart_id, product_key):
+        """Point an unmapped product at another of its lines still in the cart, if any"""
+        cart = self._collection.find_one({"_id": cart_id}, {"items": 1})
+        for other in (cart or {}).get("items", {}).values():
+            if cart_product_key(other.get("product_id"), other["product_name"]) == product_key:
+                self._collection.update_one(
+                    {"_id": cart_id, f"products.{product_key}": {"$exists": False},
+                     f"items.{other['id']}": {"$exists": True}},
+                    {"$set": {f"products.{product_key}": other["id"]}}
+                )
+                return
+
+    def clear(self, cart_id):
+        self._collection.delete_one({"_id": cart_id})
+
+class MemoryCartStore:
+    """Same interface as MongoCartStore, kept in this process only"""
+
+    def __init__(self):
+        self._carts = {}
+        self._lock = threading.Lock()
+
+    def _cart(self, cart_id):
+        return self._carts.setdefault(cart_id, {"items": {}, "products": {}, "total": 0})
+
+    def get(self, cart_id):
+        with self._lock:
+            cart = self._carts.get(cart_id)
+            if not cart:
+                return [], 0
+            return [dict(item) for item in cart["items"].values()], round(cart["total"], 2)
+
+    def count(self, cart_id):
+        with self._lock:
+            cart = self._carts.get(cart_id)
+            return len(cart["items"]) if cart else 0
+
+    def get_item(self, cart_id, item_id):
+        with self._lock:
+            item = self._carts.get(cart_id, {}).get("items", {}).get(item_id)
+            return dict(item) if item else None
+
+    def find_product_item(self, cart_id, product_key):
+        with self._lock:
+            cart = self._carts.get(cart_id)
+            item_id = cart["products"].get(product_key) if cart else None
+            return dict(cart["items"][item_id]) if item_id else None
+
+    def add_item(self, cart_id, item):
+        with self._lock:
+            cart = self._cart(cart_id)
+            cart["items"][item["id"]] = dict(item)
+            cart["products"].setdefault(cart_product_key(item.get("product_id"), item["product_name"]), item["id"])
+            cart["total"] += item.get("price", 0)
+
+    def update_item(self, cart_id, item_id, changes):
+        with self._lock:
+            item = self._carts.get(cart_id, {}).get("items", {}).get(item_id)
+            if item is None:
+                return False
+            self._carts[cart_id]["total"] += changes.get("price", item.get("price", 0)) - item.get("price", 0)
+            item.update(changes)
+            return True
+
+    def add_or_merge(self, cart_id, item, merge):
+        with self._lock:
+            cart = self._cart(cart_id)
+            product_key = cart_product_key(item.get("product_id"), item["product_name"])
+            existing_id = cart["products"].get(product_key)
+            changes = merge(dict(cart["items"][existing_id]), item) if existing_id else None
+            if changes is None:
+                cart["items"][item["id"]] = dict(item)
+                cart["products"].setdefault(product_key, item["id"])
+                cart["total"] += item.get("price", 0)
+                return None
+            existing = cart["items"][existing_id]
+            cart["total"] += changes.get("price", existing.get("price", 0)) - existing.get("price", 0)
+            merged = dict(existing)
+            existing.update(changes)
+            return merged
+
+    def remove_item(self, cart_id, item_id):
+        with self._lock:
+            cart = self._carts.get(cart_id)
+            item = cart["items"].pop(item_id, None) if cart else None
+            if item is None:
+                return False
+            product_key = cart_product_key(item.get("product_id"), item["product_name"])
+            if cart["products"].get(product_key) == item_id:
+                # Hand the product over to another of its lines, if any
+                others = [other["id"] for other in cart["items"].values()
+                          if cart_product_key(other.get("product_id"), other["product_name"]) == product_key]
+                if others:
+                    cart["products"][product_key] = others[0]
+                else:
+                    cart["products"].pop(product_key)
+            cart["total"] -= item.get("price", 0)
+            return True
+
+    def clear(self, cart_id):
+        with self._lock:
+            self._carts.pop(cart_id, None)
+
+cart_store = MemoryCartStore() if app.config["CART_STORE"] == "memory" else MongoCartStore(carts_col)
+
+def current_cart_id(create=False):
+    """The session's cart ID, optionally creating one"""
+    cart_id = session.get("cart_id")
+    if not cart_id and create:
+        cart_id = session["cart_id"] = uuid.uuid4().hex
+    return cart_id
+
+def get_cart():
+    """(items, total) of the session's cart"""
+    cart_id = current_cart_id()
+    return cart_store.get(cart_id) if cart_id else ([], 0)
+
+@app.before_request
+def migrate_session_cart():
+    """Move a cart stored in the session cookie by older versions into the cart store"""
+    if "cart" not in session:
+        return
+    legacy_cart = session.pop("cart")
+    if isinstance(legacy_cart, list) and legacy_cart:
+        cart_id = current_cart_id(create=True)
+        for item in legacy_cart:
+            if isinstance(item, dict) and valid_cart_item_id(item.get("id")):
+                cart_store.add_item(cart_id, item)
+
+@app.context_processor
+def inject_cart_count():
+    """Number of items in the session's cart, for the navbar badge"""
+    cart_id = session.get("cart_id")
+    try:
+        return {"cart_count": cart_store.count(cart_id) if cart_id else 0}
+    except Exception as e:
+        print(f"Error counting cart items: {e}")
+        return {"cart_count": 0}
 
 # --- Enhanced Cart Functions ---
 
@@ -386,6 +1314,7 @@ def add_to_cart():
         recipe_quantity = request.form.get("quantity", "")
         image_url = request.form.get("image_url", url_for('static', filename='images/default.png'))
         product_id = request.form.get("product_id")
+        dish_name = request.form.get("dish_name", "").strip() or None
         
         # Get product details
         product_data = None
@@ -396,17 +1325,23 @@ def add_to_cart():
                 product_name = product.get("name", product_name)
                 image_url = product.get("image_url", image_url)
         
-        # If no product found by ID, try finding by name
+        # If no product found by ID, try finding by name. Price, identity and
+        # category all come from the one product the name resolves to.
         if not product_data:
-            norm_name = normalize_ingredient_name(product_name)
-            product_key = find_product_key(norm_name)
-            if product_key and product_key in PRODUCT_INFO:
-                product_data = PRODUCT_INFO[product_key]
+            product_key = find_product_key(normalize_ingredient_name(product_name))
+            if product_key:
                 db_product = products_col.find_one({"name_normalized": product_key})
-                if db_product:
-                    product_name = db_product.get("name", product_name)
-                    image_url = db_product.get("image_url", image_url)
-                    product_id = str(db_product["_id"])
+                price_entry = pricing_catalog.get(product_key)
+                if not db_product and price_entry:
+                    # A built-in default with no product document
+                    product_data = price_entry._asdict()
+            else:
+                db_product = resolve_ingredients([product_name])[0][1]
+            if db_product:
+                product_data = db_product
+                product_name = db_product.get("name", product_name)
+                image_url = db_product.get("image_url", image_url)
+                product_id = str(db_product["_id"])
         
         if not product_data:
             flash(f"Could not find product information for '{product_name}'", "warning")
@@ -418,7 +1353,8 @@ def add_to_cart():
         default_qty = product_data.get("default_qty", f"{min_qty} {unit}")
         
         # Use recipe quantity if valid, otherwise use default
-        quantity_to_add = parse_and_validate_quantity(recipe_quantity, default_qty, min_qty, unit)
+        quantity_to_add = parse_and_validate_quantity(recipe_quantity, default_qty, min_qty, unit,
+                                                      normalize_ingredient_name(product_name))
         price = calculate_price(product_name, quantity_to_add)
         
         # Create cart item
@@ -431,37 +1367,18 @@ def add_to_cart():
             "price": price,
             "unit": unit,
             "min_qty": min_qty,
-            "product_id": product_id
+            "product_id": product_id,
+            "category": product_data.get("category"),
+            "dish_name": dish_name
         }
         
-        # Add to cart or update existing item
-        cart = session.get("cart", [])
-        if not isinstance(cart, list):
-            cart = []
-        
-        # Check if product already in cart
-        for i, cart_item in enumerate(cart):
-            if (cart_item.get("product_id") and cart_item.get("product_id") == item["product_id"]) or \
-               (not cart_item.get("product_id") and cart_item["product_name"] == item["product_name"]):
-                # Update quantity if units match
-                try:
-                    existing_qty_val, existing_unit = parse_quantity(cart_item["quantity"])
-                    new_qty_val, new_unit = parse_quantity(item["quantity"])
-                    
-                    if existing_unit == new_unit:
-                        updated_qty_val = existing_qty_val + new_qty_val
-                        cart[i]["quantity"] = f"{updated_qty_val} {existing_unit}"
-                        cart[i]["price"] = calculate_price(cart_item["product_name"], cart[i]["quantity"])
-                        flash(f"Updated quantity for {cart_item['product_name']} in cart", "success")
-                        session["cart"] = cart
-                        return redirect(request.referrer or url_for('index'))
-                except Exception as e:
-                    print(f"Error updating quantity: {e}")
-        
-        # If not updated, add as new item
-        cart.append(item)
-        flash(f"Added {item['product_name']} to cart", "success")
-        session["cart"] = cart
+        # Add to cart, or merge into the line already holding this product
+        cart_id = current_cart_id(create=True)
+        merged = cart_store.add_or_merge(cart_id, item, merge_cart_quantities)
+        if merged:
+            flash(f"Updated quantity for {merged['product_name']} in cart", "success")
+        else:
+            flash(f"Added {item['product_name']} to cart", "success")
         
         return redirect(request.referrer or url_for('index'))
     
@@ -470,7 +1387,25 @@ def add_to_cart():
         print(f"Error in add_to_cart: {traceback.format_exc()}")
         return redirect(request.referrer or url_for('index'))
 
-def parse_and_validate_quantity(recipe_quantity, default_qty, min_qty, base_unit):
+def merge_cart_quantities(cart_item, item):
+    """Changes adding item's quantity to cart_item, or None when the units can't be combined"""
+    try:
+        existing_qty_val, existing_unit = parse_quantity(cart_item["quantity"])
+        new_qty_val, new_unit = parse_quantity(item["quantity"])
+        new_qty_val = units.convert(new_qty_val, new_unit, existing_unit,
+                                    normalize_ingredient_name(cart_item["product_name"]))
+        if new_qty_val is None:
+            return None
+        updated_quantity = f"{existing_qty_val + new_qty_val} {existing_unit}"
+        return {
+            "quantity": updated_quantity,
+            "price": calculate_price(cart_item["product_name"], updated_quantity)
+        }
+    except Exception as e:
+        print(f"Error updating quantity: {e}")
+        return None
+
+def parse_and_validate_quantity(recipe_quantity, default_qty, min_qty, base_unit, ingredient=None):
     """Parse quantity and ensure it meets minimum requirements"""
     if not recipe_quantity:
         return default_qty
@@ -478,67 +1413,49 @@ def parse_and_validate_quantity(recipe_quantity, default_qty, min_qty, base_unit
     try:
         amount, unit = parse_quantity(recipe_quantity)
         
-        # Check if units match or are convertible
-        unit_compatible = unit == base_unit or \
-                         (unit in ['gm', 'kg'] and base_unit in ['gm', 'kg']) or \
-                         (unit in ['ml', 'liter'] and base_unit in ['ml', 'liter']) or \
-                         (unit == 'bunch' and base_unit == 'bunch')
-                         
-        if unit_compatible:
-            # Convert to base unit for comparison if needed
-            converted_amount = amount
-            if unit == 'gm' and base_unit == 'kg':
-                converted_amount = amount / 1000
-            elif unit == 'kg' and base_unit == 'gm':
-                converted_amount = amount * 1000
-            elif unit == 'ml' and base_unit == 'liter':
-                converted_amount = amount / 1000
-            elif unit == 'liter' and base_unit == 'ml':
-                converted_amount = amount * 1000
-                
-            if converted_amount >= min_qty:
-                return recipe_quantity
-            else:
-                return f"{min_qty} {base_unit}"
-        else:
+        # Convert to base unit for comparison; None if the units aren't compatible
+        converted_amount = units.convert(amount, unit, base_unit, ingredient)
+        if converted_amount is None:
             return default_qty
+        if converted_amount >= min_qty:
+            return recipe_quantity
+        return f"{min_qty} {base_unit}"
     except Exception:
         return default_qty
 
 @app.route("/cart")
 def view_cart():
-    cart = session.get("cart", [])
-    if not isinstance(cart, list):
-        cart = []
-    total = sum(item.get("price", 0) for item in cart)
+    cart, total = get_cart()
     return render_template("cart.html", cart=cart, total=total)
 
 @app.route("/update_cart", methods=["POST"])
 def update_cart():
-    cart = session.get("cart", [])
-    if not isinstance(cart, list):
-        cart = []
+    cart_id = current_cart_id()
         
     try:
         item_id = request.form["item_id"]
         new_quantity = float(request.form["quantity"])
         
-        for item in cart:
-            if item.get("id") == item_id:
-                unit = item.get("unit", "unit")
-                min_qty = item.get("min_qty", 0)
-                
-                if new_quantity < min_qty:
-                    flash(f"Minimum quantity for {item['product_name']} is {min_qty} {unit}", "warning")
-                elif new_quantity == 0:
-                    return redirect(url_for('remove_from_cart', item_id=item_id))
-                else:
-                    item["quantity"] = f"{new_quantity} {unit}"
-                    item["price"] = calculate_price(item["product_name"], item["quantity"])
+        item = cart_store.get_item(cart_id, item_id) if cart_id else None
+        if item:
+            unit = item.get("unit", "unit")
+            min_qty = item.get("min_qty", 0)
+            
+            if new_quantity < min_qty:
+                flash(f"Minimum quantity for {item['product_name']} is {min_qty} {unit}", "warning")
+            elif new_quantity == 0:
+                return redirect(url_for('remove_from_cart', item_id=item_id))
+            else:
+                quantity = f"{new_quantity} {unit}"
+                updated = cart_store.update_item(cart_id, item_id, {
+                    "quantity": quantity,
+                    "price": calculate_price(item["product_name"], quantity)
+                })
+                if updated:
                     flash(f"Updated quantity for {item['product_name']}", "success")
-                break
+                else:
+                    flash(f"Could not update {item['product_name']}, it may have been removed", "warning")
                 
-        session["cart"] = cart
     except ValueError:
         flash("Invalid quantity format", "danger")
     except Exception as e:
@@ -549,33 +1466,311 @@ def update_cart():
 
 @app.route("/remove_from_cart/<item_id>")
 def remove_from_cart(item_id):
-    cart = session.get("cart", [])
-    if not isinstance(cart, list):
-        cart = []
-        
-    original_length = len(cart)
-    cart = [item for item in cart if item.get("id") != item_id]
+    cart_id = current_cart_id()
     
-    if len(cart) < original_length:
+    if cart_id and cart_store.remove_item(cart_id, item_id):
         flash("Item removed from cart", "success")
     else:
         flash("Item not found in cart", "warning")
         
-    session["cart"] = cart
     return redirect(url_for("view_cart"))
 
+# --- Inventory ---
+
+class OutOfStockError(Exception):
+    """Raised by StockLedger.reserve when some lines can't be covered"""
+
+    def __init__(self, product_ids):
+        super().__init__(f"Not enough stock for {len(product_ids)} product(s)")
+        self.product_ids = product_ids
+
+class CheckoutPendingError(Exception):
+    """Raised by place_order when another submit of the same checkout is still placing it"""
+
+class StockLedger:
+    """Per-product stock with reservations taken at checkout.
+
+    Products that carry a stock_available field are stock-tracked; the
+    rest are sold without limit. A reservation moves quantity from
+    stock_available to stock_reserved with one conditional $inc per
+    product, all sent in a single unordered bulk write, so two checkouts
+    can never both take the last unit. Each applied $inc also pushes the
+    attempt's hold token onto the product's stock_holds, which is how a
+    partial reservation, a commit or a release finds exactly the lines it
+    applied. A released reservation can be taken again under the same ID
+    (a retried checkout) with a fresh token, so a late release of the old
+    attempt never touches the new one. Reservations that are never
+    committed (the worker died mid-checkout) are released once they expire.
+    """
+
+    def __init__(self, products, reservations, ttl_seconds=900, sweep_interval=60):
+        self._products = products
+        self._reservations = reservations
+        self._ttl = ttl_seconds
+        self._sweep_interval = sweep_interval
+        self._next_sweep = 0
+
+    def _tracked_lines(self, lines):
+        """Sum (product_id, qty) lines per stock-tracked product"""
+        wanted = {}
+        for product_id, qty in lines:
+            if product_id and ObjectId.is_valid(product_id) and qty > 0:
+                oid = ObjectId(product_id)
+                wanted[oid] = wanted.get(oid, 0) + qty
+        if not wanted:
+            return []
+        tracked = self._products.find({"_id": {"$in": list(wanted)}, "stock_available": {"$exists": True}}, {"_id": 1})
+        return [{"product_id": doc["_id"], "qty": round(wanted[doc["_id"]], 3)} for doc in tracked]
+
+    @staticmethod
+    def _hold(reservation):
+        # Reservations written before hold tokens existed used their ID
+        return reservation.get("hold", reservation["_id"])
+
+    def _undo(self, hold, lines):
+        """Return held quantity to stock_available for every line this hold applied"""
+        requests = [UpdateOne({"_id": line["product_id"], "stock_holds": hold},
+                              {"$inc": {"stock_available": line["qty"], "stock_reserved": -line["qty"]},
+                               "$pull": {"stock_holds": hold}})
+                    for line in lines]
+        if requests:
+            self._products.bulk_write(requests, ordered=False)
+
+    def reserve(self, reservation_id, lines):
+        """Hold stock for (product_id, qty) lines, all or nothing.
+
+        Returns False if a held or committed reservation with this ID
+        already exists (another submit of the same checkout owns it), True
+        if this call took it, either fresh or by re-taking a released one.
+        Raises OutOfStockError, holding nothing, when any line is short.
+        """
+        if time.time() >= self._next_sweep:
+            self.release_expired()
+
+        lines = self._tracked_lines(lines)
+        hold = uuid.uuid4().hex
+        fields = {
+            "status": "held",
+            "hold": hold,
+            "lines": lines,
+            "created_at": datetime.now(),
+            "expires_at": datetime.now() + timedelta(seconds=self._ttl)
+        }
+        try:
+            self._reservations.insert_one({"_id": reservation_id, **fields})
+        except DuplicateKeyError:
+            # A released attempt (its order insert failed) may be taken again
+            if not self._reservations.find_one_and_update(
+                    {"_id": reservation_id, "status": "released"},
+                    {"$set": fields, "$unset": {"settled_at": ""}}):
+                return False
+        if not lines:
+            return True
+
+        result = self._products.bulk_write([
+            UpdateOne({"_id": line["product_id"], "stock_available": {"$gte": line["qty"]},
+                       "stock_holds": {"$ne": hold}},
+                      {"$inc": {"stock_available": -line["qty"], "stock_reserved": line["qty"]},
+                       "$push": {"stock_holds": hold}})
+            for line in lines
+        ], ordered=False)
+        if result.modified_count == len(lines):
+            return True
+
+        # Some line was short: find which, then put back whatever was taken
+        held = {doc["_id"] for doc in self._products.find(
+            {"_id": {"$in": [line["product_id"] for line in lines]}, "stock_holds": hold}, {"_id": 1})}
+        self._undo(hold, lines)
+        self._reservations.delete_one({"_id": reservation_id, "hold": hold, "status": "held"})
+        raise OutOfStockError([str(line["product_id"]) for line in lines if line["product_id"] not in held])
+
+    def commit(self, reservation_id):
+        """Turn a reservation into a sale; False if it was no longer held"""
+        reservation = self._reservations.find_one_and_update(
+            {"_id": reservation_id, "status": "held"},
+            {"$set": {"status": "committed", "settled_at": datetime.now()}})
+        if not reservation:
+            return False
+        hold = self._hold(reservation)
+        requests = [UpdateOne({"_id": line["product_id"], "stock_holds": hold},
+                              {"$inc": {"stock_reserved": -line["qty"]}, "$pull": {"stock_holds": hold}})
+                    for line in reservation["lines"]]
+        if requests:
+            self._products.bulk_write(requests, ordered=False)
+        return True
+
+    def release(self, reservation_id):
+        """Give a held reservation's stock back; False if it was no longer held"""
+        reservation = self._reservations.find_one_and_update(
+            {"_id": reservation_id, "status": "held"},
+            {"$set": {"status": "released", "settled_at": datetime.now()}})
+        if not reservation:
+            return False
+        self._undo(self._hold(reservation), reservation["lines"])
+        return True
+
+    def status(self, reservation_id):
+        """"held", "committed" or "released"; None if there is no such reservation"""
+        reservation = self._reservations.find_one({"_id": reservation_id}, {"status": 1})
+        return reservation.get("status") if reservation else None
+
+    def release_expired(self):
+        """Release every reservation still held past its expiry"""
+        self._next_sweep = time.time() + self._sweep_interval
+        released = 0
+        try:
+            for reservation in self._reservations.find(
+                    {"status": "held", "expires_at": {"$lt": datetime.now()}}, {"_id": 1}):
+                released += self.release(reservation["_id"])
+        except Exception as e:
+            print(f"Error releasing expired stock reservations: {e}")
+        return released
+
+    def set_available(self, product_id, available):
+        """Set how much of a product can be sold; None stops tracking its stock"""
+        if available is None:
+            update = {"$unset": {"stock_available": ""}}
+        else:
+            update = {"$set": {"stock_available": available}}
+        self._products.update_one({"_id": ObjectId(product_id)}, update)
+
+stock_ledger = StockLedger(products_col, stock_reservations_col)
+
+def stock_quantity(item):
+    """A cart item's quantity in the unit its product is stocked (and priced) in"""
+    qty_value, qty_unit = parse_quantity(item["quantity"])
+    converted = units.convert(qty_value, qty_unit, item.get("unit", qty_unit),
+                              normalize_ingredient_name(item["product_name"]))
+    return qty_value if converted is None else converted
+
+# Stock field value that turns stock tracking off for a product
+STOCK_UNTRACKED = "untracked"
+
+def parse_stock_field(value):
+    """The admin form's stock field: blank or "untracked" means the product isn't stock-tracked"""
+    value = (value or "").strip()
+    if not value or value.lower() == STOCK_UNTRACKED:
+        return None
+    return max(float(value), 0)
+
 # --- Enhanced Checkout ---
 
+ORDER_STATUSES = ["pending", "processing", "shipped", "completed", "cancelled"]
+# Cart item fields an order line keeps; the cart's item ID and min_qty don't matter once ordered
+ORDER_LINE_FIELDS = ("product_id", "product_name", "ingredient_name", "quantity", "unit", "image_url",
+                     "category", "dish_name")
+
+# How long a repeated submit waits for the one holding the checkout's reservation
+CHECKOUT_WAIT_SECONDS = 5
+
+POST_ORDER_TASKS = []
+post_order_executor = ThreadPoolExecutor(max_workers=2)
+
+def post_order_task(func):
+    """Register func(order) to run in the background after every new order"""
+    POST_ORDER_TASKS.append(func)
+    return func
+
+def run_post_order_tasks(order):
+    for task in POST_ORDER_TASKS:
+        try:
+            task(order)
+        except Exception:
+            print(f"Error in post-order task {task.__name__}: {traceback.format_exc()}")
+
+@post_order_task
+def log_order(order):
+    print(f"Order {order['order_id']} placed: {order['item_count']} items, total {order['total']:.2f}")
+
+def order_line(item, price):
+    """Normalize a cart item into an order line priced at price"""
+    line = {field: item.get(field) for field in ORDER_LINE_FIELDS}
+    line["quantity_value"], line["quantity_unit"] = parse_quantity(item["quantity"])
+    line["price"] = price
+    return line
+
+def place_order(order_id, cart, customer, user_id=None):
+    """Re-price the cart and write the order with its line items.
+
+    order_id doubles as the idempotency key: the unique index on it turns a
+    repeated submit into a DuplicateKeyError, and the order already stored
+    is returned instead. Stock for the order is reserved under the same
+    key, and only the submit holding that reservation inserts the order,
+    so no order is ever stored without its stock. A concurrent submit
+    waits for the holder to finish and returns its order, or takes over
+    the reservation if the holder failed. Returns (order, created);
+    raises OutOfStockError when the cart can't be fulfilled and
+    CheckoutPendingError if the holder doesn't finish in time, or if the
+    reservation expired before the order could be committed (the order is
+    then removed again, and a resubmit re-takes the reservation).
+    """
+    # Current catalog prices, for every line in one batch
+    prices = price_many((item["product_name"], item["quantity"]) for item in cart)
+    items = [order_line(item, price) for item, price in zip(cart, prices)]
+
+    order = {
+        "order_id": order_id,
+        "order_date": datetime.now(),
+        "items": items,
+        # Summary fields, so listings can project away the items
+        "item_count": len(items),
+        "total": round(sum(prices), 2),
+        **customer,
+        "status": "pending"
+    }
+    if user_id:
+        order["user_id"] = user_id
+
+    # Hold stock first; only the submit holding the reservation goes on to insert the order
+    lines = [(item.get("product_id"), stock_quantity(item)) for item in items]
+    deadline = time.monotonic() + CHECKOUT_WAIT_SECONDS
+    while not stock_ledger.reserve(order_id, lines):
+        status = stock_ledger.status(order_id)
+        if status == "committed":
+            # Committed only after the order was stored
+            existing = orders_col.find_one({"order_id": order_id})
+            if not existing or existing.get("user_id") != user_id:
+                raise CheckoutPendingError("This checkout can't be placed again.")
+            return existing, False
+        if status == "held":
+            if time.monotonic() >= deadline:
+                raise CheckoutPendingError("Your order is still being placed. Please check back in a moment.")
+            time.sleep(0.1)
+        # Released or gone: the other submit failed, so reserve again
+
+    # One document holds the order and its line items, so this single insert is atomic
+    try:
+        orders_col.insert_one(order)
+    except DuplicateKeyError:
+        # Only the holder inserts, so this order was stored before the reservation existed
+        stock_ledger.release(order_id)
+        existing = orders_col.find_one({"order_id": order_id})
+        if not existing or existing.get("user_id") != user_id:
+            raise
+        return existing, False
+    except Exception:
+        stock_ledger.release(order_id)
+        raise
+
+    if not stock_ledger.commit(order_id):
+        # The expiry sweep released the stock while the insert ran; the order can't stand without it
+        orders_col.delete_one({"_id": order["_id"]})
+        raise CheckoutPendingError("Your checkout took too long to complete. Please place the order again.")
+    post_order_executor.submit(run_post_order_tasks, copy.deepcopy(order))
+    return order, True
+
 @app.route("/checkout", methods=["GET", "POST"])
 def checkout():
-    cart = session.get("cart", [])
-    if not isinstance(cart, list):
-        cart = []
+    cart, total = get_cart()
     if not cart:
+        # A repeated submit arrives after the first one already emptied the cart
+        checkout_key = request.form.get("checkout_key") if request.method == "POST" else None
+        existing = orders_col.find_one({"order_id": checkout_key}) if is_uuid(checkout_key) else None
+        if existing and existing.get("user_id") == session.get("user_id"):
+            flash("This order was already placed.", "info")
+            return render_template("order_confirmation.html", order=existing)
         flash("Your cart is empty", "warning")
         return redirect(url_for("index"))
-        
-    total = sum(item.get("price", 0) for item in cart)
     
     # Pre-fill form with user info if logged in
     user_data = {}
@@ -593,47 +1788,192 @@ def checkout():
         email = request.form.get("email", "").strip()
         address = request.form.get("address", "").strip()
         phone = request.form.get("phone", "").strip()
+        # Generated when the form was rendered, so a double submit carries the same key
+        checkout_key = request.form.get("checkout_key", "")
+        if not is_uuid(checkout_key):
+            checkout_key = str(uuid.uuid4())
         
         if not all([name, email, address, phone]):
             flash("Please fill in all required fields", "danger")
-            return render_template("checkout.html", cart=cart, total=total,
+            return render_template("checkout.html", cart=cart, total=total, checkout_key=checkout_key,
                                   name=name, email=email, address=address, phone=phone)
                                   
         try:
-            order = {
-                "order_id": str(uuid.uuid4()),
-                "order_date": datetime.now(),
-                "items": cart,
-                "total": total,
+            customer = {
                 "customer_name": name,
                 "customer_email": email,
                 "customer_address": address,
-                "customer_phone": phone,
-                "status": "pending"
+                "customer_phone": phone
             }
+            order, created = place_order(checkout_key, cart, customer, session.get("user_id"))
             
-            # Add user_id if logged in
-            if "user_id" in session:
-                order["user_id"] = session["user_id"]
-                
-            # Insert order
-            insert_result = orders_col.insert_one(order)
-            print(f"Order {order['order_id']} inserted with DB ID: {insert_result.inserted_id}")
-            
-            # Clear cart
-            session.pop("cart", None)
-            
-            flash("Order placed successfully!", "success")
+            if created:
+                # Clear cart
+                cart_store.clear(current_cart_id())
+                flash("Order placed successfully!", "success")
+            else:
+                flash("This order was already placed.", "info")
             
             return render_template("order_confirmation.html", order=order)
             
+        except CheckoutPendingError as e:
+            flash(str(e), "info")
+            return render_template("checkout.html", cart=cart, total=total, checkout_key=checkout_key,
+                                  name=name, email=email, address=address, phone=phone)
+        except OutOfStockError as e:
+            names = [item["product_name"] for item in cart if str(item.get("product_id")) in e.product_ids]
+            flash(f"Sorry, we don't have enough stock for: {', '.join(names)}", "warning")
+            return render_template("checkout.html", cart=cart, total=total, checkout_key=checkout_key,
+                                  name=name, email=email, address=address, phone=phone)
         except Exception as e:
             flash(f"An error occurred during checkout: {e}", "danger")
             print(f"Error in checkout: {traceback.format_exc()}")
-            return render_template("checkout.html", cart=cart, total=total,
+            return render_template("checkout.html", cart=cart, total=total, checkout_key=checkout_key,
                                   name=name, email=email, address=address, phone=phone)
     
-    return render_template("checkout.html", cart=cart, total=total, **user_data)
+    return render_template("checkout.html", cart=cart, total=total, checkout_key=str(uuid.uuid4()), **user_data)
+
+# --- Sales analytics ---
+
+class SalesRollups:
+    """Hourly and daily sales totals, kept up to date as orders come in.
+
+    Each bucket is one document in the rollup collection (_id "day:<date>"
+    or "hour:<date>T<hour>") holding revenue, order count, per-status
+    counts and per-product, per-dish and per-category sums. Orders are
+    added with $inc upserts once placed (flagged in_sales_rollups) and
+    subtracted again when they are cancelled (added back if un-cancelled),
+    always in the buckets of their order date, so reads never touch the
+    orders collection. Dish and category names are stored under a digest
+    because they can contain characters MongoDB doesn't allow in field
+    names; products use their cart product key.
+    """
+
+    GRANULARITIES = {"hour": "%Y-%m-%dT%H", "day": "%Y-%m-%d"}
+    # Order fields an order's contribution is computed from
+    ORDER_FIELDS = {"order_date": 1, "total": 1, "status": 1, "in_sales_rollups": 1, "items.product_id": 1,
+                    "items.product_name": 1, "items.price": 1, "items.category": 1, "items.dish_name": 1}
+
+    def __init__(self, collection):
+        self._collection = collection
+
+    @staticmethod
+    def field_key(label):
+        return hashlib.sha1(label.encode("utf-8")).hexdigest()[:16]
+
+    def bucket_ids(self, when):
+        return [f"{granularity}:{when.strftime(fmt)}" for granularity, fmt in self.GRANULARITIES.items()]
+
+    def _contribution(self, order, sign):
+        """$inc and $set documents adding (sign 1) or removing (sign -1) an order's sales"""
+        inc = {"revenue": sign * order.get("total", 0), "orders": sign}
+        labels = {}
+        for item in order.get("items", []):
+            price = sign * item.get("price", 0)
+            product = item.get("product_name") or "Unknown"
+            groups = [("products", cart_product_key(item.get("product_id"), product), product),
+                      ("categories", None, item.get("category") or "Uncategorized")]
+            if item.get("dish_name"):
+                groups.append(("dishes", None, item["dish_name"]))
+            for group, key, label in groups:
+                prefix = f"{group}.{key or self.field_key(label)}"
+                inc[f"{prefix}.revenue"] = inc.get(f"{prefix}.revenue", 0) + price
+                inc[f"{prefix}.lines"] = inc.get(f"{prefix}.lines", 0) + sign
+                labels[f"{prefix}.name"] = label
+        return inc, labels
+
+    def _apply(self, order_date, inc, labels=None):
+        update = {"$inc": inc, "$set": {"updated_at": datetime.now(), **(labels or {})}}
+        self._collection.bulk_write([UpdateOne({"_id": bucket_id}, update, upsert=True)
+                                     for bucket_id in self.bucket_ids(order_date)], ordered=False)
+
+    def record_order(self, order):
+        """Add an order not counted yet, in its current status"""
+        status = order.get("status", "pending")
+        inc, labels = ({}, {}) if status == "cancelled" else self._contribution(order, 1)
+        inc[f"statuses.{status}"] = 1
+        self._apply(order["order_date"], inc, labels)
+
+    def record_status_change(self, order, new_status):
+        """Move an order (as it was before the change) to new_status"""
+        old_status = order.get("status", "pending")
+        # Orders not counted yet are picked up with their current status by record_order
+        if old_status == new_status or not order.get("in_sales_rollups"):
+            return
+        inc = {}
+        if new_status == "cancelled":
+            inc, _ = self._contribution(order, -1)
+        elif old_status == "cancelled":
+            inc, _ = self._contribution(order, 1)
+        inc[f"statuses.{old_status}"] = inc.get(f"statuses.{old_status}", 0) - 1
+        inc[f"statuses.{new_status}"] = inc.get(f"statuses.{new_status}", 0) + 1
+        self._apply(order["order_date"], inc)
+
+    def summary(self, granularity, start, end, top=10):
+        """Series and totals for every bucket from start to end (datetimes), from the rollups alone"""
+        fmt = self.GRANULARITIES[granularity]
+        buckets = self._collection.find({"_id": {"$gte": f"{granularity}:{start.strftime(fmt)}",
+                                                 "$lte": f"{granularity}:{end.strftime(fmt)}"}}).sort("_id", ASCENDING)
+        series = []
+        totals = {"revenue": 0, "orders": 0, "statuses": Counter()}
+        groups = {"products": {}, "dishes": {}, "categories": {}}
+        for bucket in buckets:
+            series.append({"bucket": bucket["_id"].split(":", 1)[1],
+                           "revenue": round(bucket.get("revenue", 0), 2),
+                           "orders": bucket.get("orders", 0)})
+            totals["revenue"] += bucket.get("revenue", 0)
+            totals["orders"] += bucket.get("orders", 0)
+            totals["statuses"].update(bucket.get("statuses", {}))
+            for group, merged in groups.items():
+                for key, entry in bucket.get(group, {}).items():
+                    target = merged.setdefault(key, {"name": entry.get("name"), "revenue": 0, "lines": 0})
+                    target["revenue"] += entry.get("revenue", 0)
+                    target["lines"] += entry.get("lines", 0)
+
+        def ranked(entries, limit=None):
+            rows = sorted((dict(entry, revenue=round(entry["revenue"], 2)) for entry in entries.values()
+                           if entry["lines"] > 0), key=lambda entry: entry["revenue"], reverse=True)
+            return rows[:limit] if limit else rows
+
+        return {
+            "granularity": granularity,
+            "revenue": round(totals["revenue"], 2),
+            "orders": totals["orders"],
+            "statuses": {status: count for status, count in totals["statuses"].items() if count},
+            "series": series,
+            "top_products": ranked(groups["products"], top),
+            "top_dishes": ranked(groups["dishes"], top),
+            "category_mix": ranked(groups["categories"])
+        }
+
+sales_rollups = SalesRollups(sales_rollups_col)
+
+@post_order_task
+def record_order_sales(order):
+    # Claim the order and read its current status in one step, so a status
+    # change racing this task is counted exactly once
+    current = orders_col.find_one_and_update(
+        {"order_id": order["order_id"], "in_sales_rollups": {"$exists": False}},
+        {"$set": {"in_sales_rollups": True}},
+        projection=SalesRollups.ORDER_FIELDS,
+        return_document=ReturnDocument.AFTER
+    )
+    if current:
+        sales_rollups.record_order(current)
+
+def set_order_status(order_id, status):
+    """Change an order's status and move it in the sales rollups; returns the order as it was, or None"""
+    previous = orders_col.find_one_and_update(
+        {"order_id": order_id},
+        {"$set": {"status": status, "last_updated": datetime.now()}},
+        projection=SalesRollups.ORDER_FIELDS
+    )
+    if previous:
+        try:
+            sales_rollups.record_status_change(previous, status)
+        except Exception as e:
+            print(f"Error updating sales rollups for order {order_id}: {e}")
+    return previous
 
 # --- Admin Panel ---
 
@@ -678,6 +2018,7 @@ def admin_panel():
                 price_per_unit = float(request.form.get("price_per_unit", 0))
                 unit = request.form.get("unit", "unit").lower().strip()
                 min_qty = float(request.form.get("min_qty", 1))
+                stock = parse_stock_field(request.form.get("stock"))
                 
                 # Normalize name
                 name_normalized = normalize_ingredient_name(name)
@@ -686,7 +2027,7 @@ def admin_panel():
                 tags_list = [tag.strip() for tag in tags.split(",") if tag.strip()]
                 
                 # Insert product
-                products_col.insert_one({
+                product = {
                     "name": name,
                     "name_normalized": name_normalized,
                     "image_url": image_url,
@@ -697,21 +2038,21 @@ def admin_panel():
                     "unit": unit,
                     "min_qty": min_qty,
                     "added_date": datetime.now()
-                })
-                
+                }
+                if stock is not None:
+                    product.update({"stock_available": stock, "stock_reserved": 0})
+                products_col.insert_one(product)
+                # The ingredient has a product now
+                unmatched_col.delete_one({"_id": name_normalized})
+                product_index.invalidate()
+                facet_cache.invalidate()
+                pricing_catalog.bump()
+                # After the invalidation, so the refresh matches against the new catalog
+                schedule_recipe_refresh(name_keys=[name_normalized])
                 flash(f"Product '{name}' added successfully", "success")
-                
-                # Update PRODUCT_INFO dictionary
-                if name_normalized not in PRODUCT_INFO:
-                    PRODUCT_INFO[name_normalized] = {
-                        "default_qty": f"1 {unit}",
-                        "unit": unit,
-                        "price_per_unit": price_per_unit,
-                        "min_qty": min_qty
-                    }
                     
             except ValueError:
-                flash("Invalid number format for price or minimum quantity", "danger")
+                flash("Invalid number format for price, minimum quantity or stock", "danger")
             except Exception as e:
                 flash(f"Error adding product: {e}", "danger")
                 print(f"Error adding product: {e}")
@@ -721,19 +2062,23 @@ def admin_panel():
     # Get data for display
     try:
         products = list(products_col.find().sort("name", 1))
-        unmatched_suggestions = list(suggestions_col.find({"status": "unmatched"}).sort("timestamp", -1))
-        recent_orders = list(orders_col.find().sort("order_date", -1).limit(10))
-        categories = products_col.distinct("category")
+        unmatched_suggestions, unmatched_next, unmatched_prev = keyset_paginate(
+            unmatched_col, {}, UNMATCHED_SORT, request.args.get("unmatched_cursor"), UNMATCHED_PER_PAGE)
+        recent_orders = list(orders_col.find({}, ORDER_SUMMARY_FIELDS).sort(ORDER_SORT).limit(10))
+        categories = facet_cache.categories()
     except Exception as e:
         flash(f"Error fetching data: {e}", "danger")
         products = []
         unmatched_suggestions = []
+        unmatched_next = unmatched_prev = None
         recent_orders = []
         categories = []
         
     return render_template("admin_panel.html",
                           products=products,
                           unmatched_suggestions=unmatched_suggestions,
+                          unmatched_next_cursor=unmatched_next,
+                          unmatched_prev_cursor=unmatched_prev,
                           orders=recent_orders,
                           categories=categories)
 
@@ -750,21 +2095,27 @@ def view_orders():
         if customer_filter:
             query["customer_name"] = {"$regex": customer_filter, "$options": "i"}
             
-        orders = list(orders_col.find(query).sort("order_date", -1))
+        orders, next_token, prev_token = keyset_paginate(
+            orders_col, query, ORDER_SORT, request.args.get("cursor"), ORDERS_PER_PAGE, ORDER_SUMMARY_FIELDS)
+        total_orders = cached_count(orders_col, query)
         
-        # Get distinct statuses for filtering
-        statuses = orders_col.distinct("status")
+        statuses = ORDER_STATUSES
     except Exception as e:
         flash(f"Error fetching orders: {e}", "danger")
         print(f"Error fetching orders: {e}")
         orders = []
         statuses = []
+        next_token = prev_token = None
+        total_orders = 0
         
     return render_template("orders.html", 
                           orders=orders, 
                           statuses=statuses,
                           current_status=status_filter,
-                          customer_filter=customer_filter)
+                          customer_filter=customer_filter,
+                          total_orders=total_orders,
+                          next_cursor=next_token,
+                          prev_cursor=prev_token)
 
 @app.route("/admin/order/<order_id>")
 @admin_required
@@ -790,19 +2141,15 @@ def view_order(order_id):
 @app.route("/update_order_status/<order_id>/<status>")
 @admin_required
 def update_order_status(order_id, status):
-    valid_statuses = ["pending", "processing", "shipped", "completed", "cancelled"]
-    if status not in valid_statuses:
+    if status not in ORDER_STATUSES:
         flash(f"Invalid status '{status}'", "warning")
         return redirect(url_for("view_orders"))
         
     try:
-        result = orders_col.update_one(
-            {"order_id": order_id},
-            {"$set": {"status": status, "last_updated": datetime.now()}}
-        )
+        previous = set_order_status(order_id, status)
         
-        if result.matched_count == 1:
-            if result.modified_count == 1:
+        if previous:
+            if previous.get("status") != status:
                 flash(f"Order status updated to '{status}'", "success")
             else:
                 flash(f"Order status was already '{status}'", "info")
@@ -811,6 +2158,8 @@ def update_order_status(order_id, status):
     except Exception as e:
         flash(f"Error updating order status: {e}", "danger")
         print(f"Error updating status for order {order_id}: {e}")
+        
+    return redirect(request.referrer or url_for("view_orders"))
 
 
 @app.route("/admin/products")
@@ -820,33 +2169,39 @@ def manage_products():
         search_query = request.args.get("search", "")
         category_filter = request.args.get("category", "")
         
-        # Build query
-        query = {}
-        if search_query:
-            query["$or"] = [
-                {"name": {"$regex": search_query, "$options": "i"}},
-                {"description": {"$regex": search_query, "$options": "i"}},
-                {"tags": {"$regex": search_query, "$options": "i"}}
-            ]
+        page_token = request.args.get("cursor")
         
-        if category_filter:
-            query["category"] = category_filter
-            
         # Fetch products
-        products = list(products_col.find(query).sort("name", 1))
-        categories = products_col.distinct("category")
+        if search_query:
+            matches = product_index.search(search_query, category_filter)
+            products, next_token, prev_token = paginate_list(matches, page_token, ADMIN_PER_PAGE)
+            total_products = len(matches)
+        else:
+            query = {}
+            if category_filter:
+                query["category"] = category_filter
+            products, next_token, prev_token = keyset_paginate(
+                products_col, query, PRODUCT_SORT, page_token, ADMIN_PER_PAGE)
+            total_products = cached_count(products_col, query)
+        categories = facet_cache.categories()
         
     except Exception as e:
         flash(f"Error fetching products: {e}", "danger")
         print(f"Error in manage_products: {traceback.format_exc()}")
         products = []
         categories = []
+        next_token = prev_token = None
+        total_products = 0
         
     return render_template("manage_products.html", 
                           products=products,
                           categories=categories,
+                          category_counts=facet_cache.category_counts(),
                           search_query=search_query,
-                          current_category=category_filter)
+                          current_category=category_filter,
+                          total_products=total_products,
+                          next_cursor=next_token,
+                          prev_cursor=prev_token)
 
 @app.route("/admin/product/edit/<product_id>", methods=["GET", "POST"])
 @admin_required
@@ -873,6 +2228,9 @@ def edit_product(product_id):
                 price_per_unit = float(request.form.get("price_per_unit", 0))
                 unit = request.form.get("unit", "unit").lower().strip()
                 min_qty = float(request.form.get("min_qty", 1))
+                # A blank stock field leaves the current stock level alone; "untracked" turns tracking off
+                stock_field = request.form.get("stock", "").strip()
+                stock = parse_stock_field(stock_field)
                 
                 # Normalize name
                 name_normalized = normalize_ingredient_name(name)
@@ -896,21 +2254,19 @@ def edit_product(product_id):
                         "last_updated": datetime.now()
                     }}
                 )
-                
+                if stock_field:
+                    stock_ledger.set_available(product_id, stock)
+                product_index.invalidate()
+                facet_cache.invalidate()
+                pricing_catalog.bump()
+                # After the invalidation, so the refresh matches against the new catalog
+                schedule_recipe_refresh(product_id, [product.get("name_normalized"), name_normalized])
                 flash(f"Product '{name}' updated successfully", "success")
                 
-                # Update PRODUCT_INFO dictionary
-                PRODUCT_INFO[name_normalized] = {
-                    "default_qty": f"1 {unit}",
-                    "unit": unit,
-                    "price_per_unit": price_per_unit,
-                    "min_qty": min_qty
-                }
-                
                 return redirect(url_for("manage_products"))
                 
             except ValueError:
-                flash("Invalid number format for price or minimum quantity", "danger")
+                flash("Invalid number format for price, minimum quantity or stock", "danger")
             except Exception as e:
                 flash(f"Error updating product: {e}", "danger")
                 print(f"Error updating product: {traceback.format_exc()}")
@@ -921,7 +2277,7 @@ def edit_product(product_id):
         return redirect(url_for("manage_products"))
         
     # Get categories for dropdown
-    categories = products_col.distinct("category")
+    categories = facet_cache.categories()
     
     return render_template("edit_product.html", product=product, categories=categories)
 
@@ -936,11 +2292,11 @@ def delete_product(product_id):
             
         # Delete product
         products_col.delete_one({"_id": ObjectId(product_id)})
-        
-        # Remove from PRODUCT_INFO if present
-        name_normalized = product.get("name_normalized")
-        if name_normalized and name_normalized in PRODUCT_INFO:
-            del PRODUCT_INFO[name_normalized]
+        product_index.invalidate()
+        facet_cache.invalidate()
+        pricing_catalog.bump()
+        # After the invalidation, so the refresh matches against the new catalog
+        schedule_recipe_refresh(product_id)
             
         flash(f"Product '{product.get('name')}' deleted successfully", "success")
         
@@ -973,17 +2329,24 @@ def manage_users():
                 query["is_admin"] = False
                 
         # Fetch users
-        users = list(users_col.find(query).sort("username", 1))
+        users, next_token, prev_token = keyset_paginate(
+            users_col, query, USER_SORT, request.args.get("cursor"), ADMIN_PER_PAGE)
+        total_users = cached_count(users_col, query)
         
     except Exception as e:
         flash(f"Error fetching users: {e}", "danger")
         print(f"Error in manage_users: {traceback.format_exc()}")
         users = []
+        next_token = prev_token = None
+        total_users = 0
         
     return render_template("manage_users.html", 
                           users=users,
                           search_query=search_query,
-                          role_filter=role_filter)
+                          role_filter=role_filter,
+                          total_users=total_users,
+                          next_cursor=next_token,
+                          prev_cursor=prev_token)
 
 @app.route("/admin/user/<user_id>", methods=["GET", "POST"])
 @admin_required
@@ -1046,45 +2409,43 @@ def browse_products():
     category = request.args.get("category", "")
     
     try:
-        # Build query
-        query = {}
-        if search_query:
-            query["$or"] = [
-                {"name": {"$regex": search_query, "$options": "i"}},
-                {"description": {"$regex": search_query, "$options": "i"}},
-                {"tags": {"$regex": search_query, "$options": "i"}}
-            ]
-            
-        if category:
-            query["category"] = category
-            
-        # Pagination
-        page = int(request.args.get("page", 1))
-        per_page = 12
-        skip = (page - 1) * per_page
+        # Pagination: an opaque cursor instead of a page number, so deep pages
+        # don't make MongoDB skip over everything before them
+        page_token = request.args.get("cursor")
         
         # Fetch products
-        products = list(products_col.find(query).sort("name", 1).skip(skip).limit(per_page))
-        total_products = products_col.count_documents(query)
-        total_pages = (total_products + per_page - 1) // per_page
+        if search_query:
+            matches = product_index.search(search_query, category)
+            products, next_token, prev_token = paginate_list(matches, page_token, PRODUCTS_PER_PAGE)
+            total_products = len(matches)
+        else:
+            query = {}
+            if category:
+                query["category"] = category
+            products, next_token, prev_token = keyset_paginate(
+                products_col, query, PRODUCT_SORT, page_token, PRODUCTS_PER_PAGE)
+            total_products = cached_count(products_col, query)
         
         # Get categories for sidebar
-        categories = products_col.distinct("category")
+        categories = facet_cache.categories()
         
     except Exception as e:
         flash(f"Error fetching products: {e}", "danger")
         print(f"Error in browse_products: {traceback.format_exc()}")
         products = []
         categories = []
-        total_pages = 1
+        next_token = prev_token = None
+        total_products = 0
         
     return render_template("browse_products.html",
                           products=products,
                           categories=categories,
+                          category_counts=facet_cache.category_counts(),
                           search_query=search_query,
                           current_category=category,
-                          page=page,
-                          total_pages=total_pages)
+                          total_products=total_products,
+                          next_cursor=next_token,
+                          prev_cursor=prev_token)
 
 @app.route("/product/<product_id>")
 def product_detail(product_id):
@@ -1107,40 +2468,354 @@ def product_detail(product_id):
         
     return render_template("product_detail.html", product=product, related_products=related_products)
 
+# --- Recipe response cache ---
+
+class RecipeCache:
+    """Two-tier TTL cache for generated ingredient lists.
+
+    The first tier is an in-process LRU; the second is the llm_cache
+    collection, shared by every worker and expired by a TTL index on
+    expires_at. A hit in either tier skips the LLM call entirely.
+    """
+
+    def __init__(self, collection, max_entries=1024, ttl_seconds=7 * 24 * 3600):
+        self._collection = collection
+        self._max_entries = max_entries
+        self._ttl = timedelta(seconds=ttl_seconds)
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._stats = {"memory_hits": 0, "shared_hits": 0, "misses": 0, "stores": 0}
+
+    @staticmethod
+    def make_key(dish_name, dietary_preferences=None):
+        """Build the cache key from the inputs that determine the prompt"""
+        dish = " ".join(dish_name.lower().split())
+        preferences = sorted({pref.strip().lower() for pref in dietary_preferences or [] if pref.strip()})
+        return f"{dish}|{','.join(preferences)}"
+
+    def _count(self, stat):
+        with self._lock:
+            self._stats[stat] += 1
+
+    def _remember(self, key, value, expires_at):
+        with self._lock:
+            self._entries[key] = (value, expires_at)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self._max_entries:
+                self._entries.popitem(last=False)
+
+    def get(self, key):
+        """Return a copy of the cached value for key, or None"""
+        now = datetime.now()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry and entry[1] > now:
+                self._entries.move_to_end(key)
+                self._stats["memory_hits"] += 1
+                return copy.deepcopy(entry[0])
+            if entry:
+                del self._entries[key]
+
+        try:
+            doc = self._collection.find_one({"_id": key, "expires_at": {"$gt": now}})
+        except Exception as e:
+            print(f"Error reading recipe cache: {e}")
+            doc = None
+
+        if doc:
+            self._remember(key, doc["value"], doc["expires_at"])
+            self._count("shared_hits")
+            return copy.deepcopy(doc["value"])
+
+        self._count("misses")
+        return None
+
+    def set(self, key, value):
+        """Store value in both tiers"""
+        now = datetime.now()
+        expires_at = now + self._ttl
+        value = copy.deepcopy(value)
+        self._remember(key, value, expires_at)
+        self._count("stores")
+        try:
+            self._collection.replace_one(
+                {"_id": key},
+                {"value": value, "created_at": now, "expires_at": expires_at},
+                upsert=True
+            )
+        except Exception as e:
+            print(f"Error writing recipe cache: {e}")
+
+    def get_stats(self):
+        """Hit/miss counters plus the current in-process size"""
+        with self._lock:
+            stats = dict(self._stats)
+            stats["memory_entries"] = len(self._entries)
+        lookups = stats["memory_hits"] + stats["shared_hits"] + stats["misses"]
+        stats["hit_rate"] = round((lookups - stats["misses"]) / lookups, 4) if lookups else 0.0
+        return stats
+
+recipe_cache = RecipeCache(llm_cache_col)
+
+# --- Asynchronous recipe generation ---
+
+class RecipeJobs:
+    """Runs recipe generation on a bounded thread pool.
+
+    A form submit gets a job ID back immediately instead of holding a
+    request worker for the whole LLM call; the browser polls
+    /api/recipe_jobs/<id>. The generated list doesn't depend on servings,
+    so jobs for the same dish and diet submitted while one generation is
+    running all wait for that generation, then each is scaled and matched
+    for its own servings. Job state is also written to the recipe_jobs
+    collection (expired by a TTL index), so a poll landing on another
+    worker process still finds the job.
+    """
+
+    # What a poll needs, stored in MongoDB
+    SHARED_FIELDS = ("status", "dish_name", "servings", "ingredients", "matched_products", "error_message",
+                     "started_at")
+
+    def __init__(self, collection, max_workers=4, max_pending=32, ttl_seconds=600):
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="recipe-job")
+        self._collection = collection
+        self._max_pending = max_pending
+        self._ttl = ttl_seconds
+        self._lock = threading.Lock()
+        self._jobs = {}
+        # Cache key -> jobs waiting on the generation running for it
+        self._generations = {}
+
+    def _expire_finished(self):
+        cutoff = time.time() - self._ttl
+        for job_id in [job_id for job_id, job in self._jobs.items()
+                       if job["finished_at"] and job["finished_at"] < cutoff]:
+            del self._jobs[job_id]
+
+    def _save(self, job):
+        try:
+            self._collection.replace_one(
+                {"_id": job["id"]},
+                {**{field: job[field] for field in self.SHARED_FIELDS},
+                 "expires_at": datetime.now() + timedelta(seconds=self._ttl)},
+                upsert=True
+            )
+        except Exception as e:
+            print(f"Error saving recipe job {job['id']}: {e}")
+
+    def submit(self, dish_name, servings, dietary_preferences, user_id, default_image_url):
+        """Queue a job, or join the queued one for the same dish, diet and servings.
+
+        servings must already be validated. Returns None when too many
+        generations are already pending.
+        """
+        key = RecipeCache.make_key(dish_name, dietary_preferences)
+        with self._lock:
+            self._expire_finished()
+            waiting = self._generations.get(key)
+            for job in waiting or ():
+                if job["servings"] == servings:
+                    if user_id:
+                        job["user_ids"].add(user_id)
+                    return job
+
+            if waiting is None and len(self._generations) >= self._max_pending:
+                return None
+
+            # A job joining a generation that is already running is running too
+            running = waiting[0] if waiting and waiting[0]["status"] == "running" else None
+            job = {
+                "id": str(uuid.uuid4()),
+                "status": "running" if running else "queued",
+                "dish_name": dish_name,
+                "servings": servings,
+                "dietary_preferences": dietary_preferences,
+                "default_image_url": default_image_url,
+                "user_ids": {user_id} if user_id else set(),
+                "ingredients": [],
+                "matched_products": [],
+                "error_message": None,
+                "created_at": time.time(),
+                "started_at": running["started_at"] if running else None,
+                "finished_at": None
+            }
+            self._jobs[job["id"]] = job
+            if waiting is None:
+                self._generations[key] = [job]
+            else:
+                waiting.append(job)
+
+        self._save(job)
+        if waiting is None:
+            self._executor.submit(self._run, key, dish_name, dietary_preferences)
+        return job
+
+    def _run(self, key, dish_name, dietary_preferences):
+        with self._lock:
+            jobs = list(self._generations[key])
+            started_at = time.time()
+            for job in jobs:
+                job["status"] = "running"
+                job["started_at"] = started_at
+        for job in jobs:
+            self._save(job)
+
+        try:
+            base_ingredients, error_message = get_base_ingredients(dish_name, dietary_preferences)
+        except Exception as e:
+            print(f"Error generating recipe for {key}: {traceback.format_exc()}")
+            base_ingredients, error_message = [], f"Error in recipe generation: {e}"
+
+        # Jobs can join until the generation is taken off the in-flight map
+        with self._lock:
+            jobs = self._generations.pop(key)
+        for job in jobs:
+            self._finish(job, base_ingredients, error_message)
+
+    def _finish(self, job, base_ingredients, error_message):
+        ingredients, unmatched = [], []
+        try:
+            if not error_message:
+                ingredients = scale_ingredients(base_ingredients, job["servings"] / BASE_SERVINGS)
+                job["matched_products"], unmatched = match_recipe_products(ingredients, job["default_image_url"])
+            job["ingredients"] = ingredients
+            job["error_message"] = error_message
+            job["status"] = "failed" if error_message else "done"
+        except Exception as e:
+            print(f"Error in recipe job {job['id']}: {traceback.format_exc()}")
+            job["error_message"] = f"Error in recipe generation: {e}"
+            job["status"] = "failed"
+        finally:
+            with self._lock:
+                user_ids = list(job["user_ids"])
+                job["finished_at"] = time.time()
+        self._save(job)
+
+        if job["status"] == "done":
+            for user_id in user_ids:
+                record_recipe_suggestion(user_id, job["dish_name"], job["servings"], job["dietary_preferences"],
+                                         ingredients, [], unmatched)
+
+    def get(self, job_id):
+        """A job started by this process, or one read back from MongoDB"""
+        with self._lock:
+            job = self._jobs.get(job_id)
+        if job:
+            return job
+        try:
+            doc = self._collection.find_one({"_id": job_id})
+        except Exception as e:
+            print(f"Error reading recipe job {job_id}: {e}")
+            return None
+        if not doc:
+            return None
+        return {"id": doc["_id"], **{field: doc.get(field) for field in self.SHARED_FIELDS}}
+
+recipe_jobs = RecipeJobs(recipe_jobs_col)
+
+def submit_recipe_job(dish_name, servings, dietary_preferences):
+    """Validate a recipe form submit and queue it; returns a JSON response"""
+    if not dish_name:
+        return jsonify({"success": False, "error": "Please enter a dish name."}), 400
+    if not servings:
+        return jsonify({"success": False, "error": "Please enter the number of servings."}), 400
+    servings, error_message = parse_servings(servings)
+    if error_message:
+        return jsonify({"success": False, "error": error_message}), 400
+
+    job = recipe_jobs.submit(dish_name, servings, dietary_preferences,
+                             session.get("user_id"),
+                             url_for('static', filename='images/default.png'))
+    if job is None:
+        return jsonify({"success": False, "error": "We're generating a lot of recipes right now. Please try again shortly."}), 503
+
+    return jsonify({
+        "success": True,
+        "job_id": job["id"],
+        "status": job["status"],
+        "status_url": url_for("api_recipe_job", job_id=job["id"])
+    }), 202
+
 # --- Helper functions ---
 
+# Recipes are generated and cached for this many servings, then rescaled locally
+BASE_SERVINGS = 2
+
 def get_scaled_ingredients(dish_name, servings, dietary_preferences=None):
     """Get ingredients for a dish and scale them for the number of servings, considering dietary preferences"""
     if not dish_name or not servings:
         return [], None, "Missing dish name or servings"
         
+    servings, error_message = parse_servings(servings)
+    if error_message:
+        return [], None, error_message
+
+    base_ingredients, error_message = get_base_ingredients(dish_name, dietary_preferences)
+    if error_message:
+        return [], None, error_message
+
+    # Since we're not getting instructions anymore, return empty list for instructions
+    return scale_ingredients(base_ingredients, servings / BASE_SERVINGS), [], None
+
+def parse_servings(servings):
+    """(servings, error_message) for a servings form value"""
     try:
         servings = int(servings)
-        if servings <= 0 or servings > 20:
-            return [], None, "Please enter a number of servings between 1 and 20"
-    except ValueError:
-        return [], None, "Invalid number format for servings"
-        
-    try:
-        # Build dietary restrictions string if needed
-        dietary_str = ""
-        if dietary_preferences:
-            dietary_str = f" The recipe must follow these dietary restrictions: {', '.join(dietary_preferences)}. Please provide suitable alternatives for any restricted ingredients."
-            
-        # Build prompt for AI
-        prompt = f"""I need the ingredients for {dish_name} scaled for {servings} servings.{dietary_str}
+    except (TypeError, ValueError):
+        return None, "Invalid number format for servings"
+    if servings <= 0 or servings > 20:
+        return None, "Please enter a number of servings between 1 and 20"
+    return servings, None
+
+def get_base_ingredients(dish_name, dietary_preferences=None):
+    """Ingredients for a dish at BASE_SERVINGS, from the recipe cache or generated on a miss.
+
+    Returns (ingredients, error_message).
+    """
+    # One cached base recipe per dish and diet serves every serving count
+    cache_key = RecipeCache.make_key(dish_name, dietary_preferences)
+    base_ingredients = recipe_cache.get(cache_key)
+    if base_ingredients is None:
+        base_ingredients, error_message = fetch_base_ingredients(dish_name, dietary_preferences)
+        if error_message:
+            return [], error_message
+        # The cache is shared by every user of this dish and diet, so only valid items go in
+        base_ingredients = [item for item in map(clean_ingredient, base_ingredients) if item]
+        if not base_ingredients:
+            return [], "Unable to generate recipe at this time. Please try again later."
+        recipe_cache.set(cache_key, base_ingredients)
+    else:
+        # Entries cached before items were validated
+        base_ingredients = [item for item in map(clean_ingredient, base_ingredients) if item]
+    return base_ingredients, None
+
+def build_recipe_prompt(dish_name, dietary_preferences=None):
+    """Prompt asking for the ingredients of a dish at BASE_SERVINGS servings"""
+    # Build dietary restrictions string if needed
+    dietary_str = ""
+    if dietary_preferences:
+        dietary_str = f" The recipe must follow these dietary restrictions: {', '.join(dietary_preferences)}. Please provide suitable alternatives for any restricted ingredients."
+
+    return f"""I need the ingredients for {dish_name} for {BASE_SERVINGS} servings.{dietary_str}
         Format as a JSON array of objects, each with 'name' and 'quantity' properties.
+        Start each quantity with a number so it can be scaled.
         Don't include instructions or additional explanation.
         Example format: 
         [
           {{"name": "tomatoes", "quantity": "2 medium"}},
           {{"name": "olive oil", "quantity": "3 tbsp"}}
         ]"""
-        
+
+def fetch_base_ingredients(dish_name, dietary_preferences=None):
+    """Ask the LLM for the ingredients of a dish at BASE_SERVINGS servings.
+
+    Returns (ingredients, error_message).
+    """
+    try:
         # Use GPT-4 with default provider
         response = g4f.ChatCompletion.create(
             model="gpt-4",
-            messages=[{"role": "user", "content": prompt}],
+            messages=[{"role": "user", "content": build_recipe_prompt(dish_name, dietary_preferences)}],
             stream=False
         )
         
@@ -1157,52 +2832,191 @@ def get_scaled_ingredients(dish_name, servings, dietary_preferences=None):
                 
                 try:
                     # Parse the JSON string
-                    import json
                     ingredients = json.loads(json_str)
                     
                     # Validate the structure
                     if not isinstance(ingredients, list):
-                        return [], None, "Invalid response format"
+                        return [], "Invalid response format"
                     
-                    # Since we're not getting instructions anymore, return empty list for instructions
-                    return ingredients, [], None
+                    return ingredients, None
                         
                 except json.JSONDecodeError as e:
                     print(f"JSON parsing error: {e}")
-                    return [], None, "Error parsing recipe data"
+                    return [], "Error parsing recipe data"
                     
-        return [], None, "Unable to generate recipe at this time. Please try again later."
+        return [], "Unable to generate recipe at this time. Please try again later."
             
     except Exception as e:
         error_msg = f"Error in recipe generation: {str(e)}"
         print(error_msg)
         print(traceback.format_exc())
-        return [], None, error_msg
+        return [], error_msg
+
+def clean_ingredient(item):
+    """An LLM ingredient as {"name": str, "quantity": str}, or None if it isn't usable"""
+    if not isinstance(item, dict):
+        return None
+    name = item.get("name")
+    quantity = item.get("quantity", "")
+    if isinstance(quantity, (int, float)) and not isinstance(quantity, bool):
+        quantity = format_amount(quantity)
+    if not isinstance(name, str) or not name.strip() or not isinstance(quantity, str):
+        return None
+    return {"name": name.strip(), "quantity": quantity.strip()}
+
+class IngredientStreamParser:
+    """Pull complete ingredient objects out of a JSON array as it streams in.
+
+    feed() takes the next chunk of LLM output and returns every top-level
+    {...} object completed by it, so each ingredient can be shown before
+    the closing bracket of the array arrives. complete is set once the
+    array has closed; skipped counts objects that didn't parse.
+    """
+
+    def __init__(self):
+        self._buffer = []
+        self._depth = 0
+        self._in_string = False
+        self._escaped = False
+        self._in_array = False
+        self.complete = False
+        self.skipped = 0
+
+    def feed(self, chunk):
+        objects = []
+        for char in chunk:
+            if self._depth:
+                self._buffer.append(char)
+
+            if self._in_string:
+                if self._escaped:
+                    self._escaped = False
+                elif char == "\\":
+                    self._escaped = True
+                elif char == '"':
+                    self._in_string = False
+            elif char == '"':
+                self._in_string = self._depth > 0
+            elif char == "[" and not self._depth:
+                self._in_array = True
+            elif char == "]" and not self._depth and self._in_array:
+                self.complete = True
+            elif char == "{":
+                if not self._depth:
+                    self._buffer = [char]
+                self._depth += 1
+            elif char == "}" and self._depth:
+                self._depth -= 1
+                if not self._depth:
+                    try:
+                        obj = json.loads("".join(self._buffer))
+                    except json.JSONDecodeError as e:
+                        print(f"JSON parsing error in stream: {e}")
+                        self.skipped += 1
+                        continue
+                    if isinstance(obj, dict) and "name" in obj:
+                        objects.append(obj)
+        return objects
 
+class IncompleteStreamError(Exception):
+    """The LLM stream ended before a clean, complete ingredient list"""
+
+def stream_base_ingredients(dish_name, dietary_preferences=None):
+    """Yield base-serving ingredients one by one as the LLM produces them.
+
+    Items are yielded as clean_ingredient() returns them, None for an
+    unusable one. Raises IncompleteStreamError at the end if the array
+    never closed or an object couldn't be parsed.
+    """
+    response = g4f.ChatCompletion.create(
+        model="gpt-4",
+        messages=[{"role": "user", "content": build_recipe_prompt(dish_name, dietary_preferences)}],
+        stream=True
+    )
+    parser = IngredientStreamParser()
+    for chunk in response:
+        if isinstance(chunk, str):
+            for item in parser.feed(chunk):
+                yield clean_ingredient(item)
+    if not parser.complete or parser.skipped:
+        raise IncompleteStreamError("The recipe stream ended before the ingredient list was complete")
+
+# Leading amount of a quantity: "2", "1.5", "1/2", "1 1/2", "1½", optionally a range like "2-3"
+_AMOUNT = units.AMOUNT_PATTERN
+QUANTITY_AMOUNT_RE = re.compile(rf'^\s*({_AMOUNT})(?:\s*-\s*({_AMOUNT}))?(.*)$', re.DOTALL)
+
+def format_amount(value):
+    """Format a scaled amount without trailing zeros ("3", "1.5", "0.33")"""
+    return f"{round(value, 2):g}"
+
+def scale_quantity(quantity, factor):
+    """Scale the leading amount of a quantity string, keeping its unit text"""
+    if factor == 1:
+        return quantity
+    if isinstance(quantity, (int, float)) and not isinstance(quantity, bool):
+        return round(quantity * factor, 2)
+    if not isinstance(quantity, str):
+        return quantity
+
+    match = QUANTITY_AMOUNT_RE.match(quantity)
+    if not match:
+        return quantity  # "to taste", "a pinch", ...
+
+    low, high, rest = match.groups()
+    amounts = [units.parse_amount(amount) for amount in (low, high) if amount]
+    if None in amounts:
+        return quantity  # "1/0 cup"
+    return "-".join(format_amount(amount * factor) for amount in amounts) + rest
+
+def scale_ingredients(ingredients, factor):
+    """Return a copy of an ingredient list with every quantity scaled by factor"""
+    scaled = []
+    for ingredient in ingredients:
+        if isinstance(ingredient, dict):
+            ingredient = dict(ingredient)
+            if "quantity" in ingredient:
+                ingredient["quantity"] = scale_quantity(ingredient["quantity"], factor)
+        scaled.append(ingredient)
+    return scaled
+
+# Descriptive words that don't change which product an ingredient is
+NORMALIZE_STOP_WORDS = ("fresh", "dried", "frozen", "canned", "whole", "sliced", "diced", "chopped", "minced")
+NORMALIZE_UNITS = ("oz", "ounce", "lb", "pound", "g", "gram", "kg", "cup", "tbsp", "tsp", "tablespoon", "teaspoon")
+
+_STOP_WORDS_PATTERN = r'\b(?:' + "|".join(NORMALIZE_STOP_WORDS) + r')\b'
+
+# Strips stop words and measurements ("2 oz", "1.5 kg") in one pass. A stop
+# word between a number and its unit ("2 fresh oz") is allowed, matching the
+# result of removing the stop words first.
+NORMALIZE_STRIP_RE = re.compile(
+    _STOP_WORDS_PATTERN
+    + r'|\d+(?:\.\d+)?(?:\s|' + _STOP_WORDS_PATTERN + r')*(?:' + "|".join(NORMALIZE_UNITS) + r')'
+)
+WHITESPACE_RE = re.compile(r'\s+')
+# berries -> berry, tomatoes -> tomato, onions -> onion
+PLURAL_RE = re.compile(r'(\w+)(ies|oes)$|(\w+[^s])s$')
+
+def _singularize(match):
+    stem, suffix, other = match.groups()
+    if suffix == "ies":
+        return stem + "y"
+    if suffix == "oes":
+        return stem + "o"
+    return other
+
+@lru_cache(maxsize=8192)
 def normalize_ingredient_name(name):
     """Normalize ingredient name for consistent lookup"""
     if not name:
         return ""
-        
-    # Convert to lowercase
-    name = name.lower()
-    
-    # Remove common words like "fresh", "dried", etc.
-    for word in ["fresh", "dried", "frozen", "canned", "whole", "sliced", "diced", "chopped", "minced"]:
-        name = re.sub(r'\b' + word + r'\b', '', name)
-    
-    # Remove measurements
-    name = re.sub(r'\d+(\.\d+)?\s*(oz|ounce|lb|pound|g|gram|kg|cup|tbsp|tsp|tablespoon|teaspoon)', '', name)
-    
+
+    name = NORMALIZE_STRIP_RE.sub('', name.lower())
+
     # Clean up extra spaces
-    name = re.sub(r'\s+', ' ', name).strip()
-    
+    name = WHITESPACE_RE.sub(' ', name).strip()
+
     # Handle plural forms - common cases
-    name = re.sub(r'(\w+)ies$', r'\1y', name)  # berries -> berry
-    name = re.sub(r'(\w+)oes$', r'\1o', name)  # tomatoes -> tomato
-    name = re.sub(r'(\w+[^s])s$', r'\1', name)  # onions -> onion
-    
-    return name
+    return PLURAL_RE.sub(_singularize, name)
 
 # Define ingredient synonyms for matching
 INGREDIENT_SYNONYMS = {
@@ -1216,7 +3030,7 @@ INGREDIENT_SYNONYMS = {
     # Add more synonyms as needed
 }
 
-# Placeholder for PRODUCT_INFO (replace with DB in production)
+# Built-in pricing defaults; products in MongoDB override and extend these (see PricingCatalog)
 PRODUCT_INFO = {
     "tomato": {"default_qty": "500 gm", "unit": "gm", "price_per_unit": 0.002, "min_qty": 500},
     "onion": {"default_qty": "250 gm", "unit": "gm", "price_per_unit": 0.0015, "min_qty": 250},
@@ -1229,72 +3043,313 @@ PRODUCT_INFO = {
     # Add more products as needed
 }
 
+def build_synonym_map(synonyms):
+    """Map every key and synonym to the canonical keys it belongs to, in table order"""
+    reverse = {}
+    for key, names in synonyms.items():
+        for name in (key, *names):
+            if key not in reverse.setdefault(name, ()):
+                reverse[name] += (key,)
+    return reverse
+
+SYNONYM_TO_CANONICAL = build_synonym_map(INGREDIENT_SYNONYMS)
+
+class KeywordAutomaton:
+    """Aho-Corasick automaton over a list of keywords.
+
+    first_match(text) scans the text once and returns the lowest index of
+    any keyword contained in it, however many keywords there are.
+    """
+
+    def __init__(self, keywords):
+        self._goto = [{}]
+        self._fail = [0]
+        self._best = [None]
+
+        for rank, keyword in enumerate(keywords):
+            node = 0
+            for char in keyword:
+                next_node = self._goto[node].get(char)
+                if next_node is None:
+                    next_node = len(self._goto)
+                    self._goto[node][char] = next_node
+                    self._goto.append({})
+                    self._fail.append(0)
+                    self._best.append(None)
+                node = next_node
+            if self._best[node] is None:
+                self._best[node] = rank
+
+        # Breadth-first pass: failure links, and fold each node's dictionary
+        # suffixes into its best rank
+        queue = list(self._goto[0].values())
+        for node in queue:
+            for char, child in self._goto[node].items():
+                fallback = self._fail[node]
+                while fallback and char not in self._goto[fallback]:
+                    fallback = self._fail[fallback]
+                target = self._goto[fallback].get(char, 0)
+                self._fail[child] = target if target != child else 0
+                queue.append(child)
+            self._best[node] = self._min_rank(self._best[node], self._best[self._fail[node]])
+
+    @staticmethod
+    def _min_rank(a, b):
+        if a is None:
+            return b
+        if b is None:
+            return a
+        return min(a, b)
+
+    def first_match(self, text):
+        best = self._best[0]
+        node = 0
+        for char in text:
+            while node and char not in self._goto[node]:
+                node = self._fail[node]
+            node = self._goto[node].get(char, 0)
+            best = self._min_rank(best, self._best[node])
+        return best
+
+class ProductKeyMatcher:
+    """Partial matching of an ingredient name against the pricing catalog keys.
+
+    Returns the first key (in dict order) that is contained in the name or
+    that contains the name. Keys inside the name come from an Aho-Corasick
+    scan; keys containing the name come from a trigram index over the keys.
+    """
+
+    def __init__(self, keys):
+        self._keys = list(keys)
+        self._automaton = KeywordAutomaton(self._keys)
+        self._short = {}
+        self._trigrams = {}
+        for rank, key in enumerate(self._keys):
+            for i in range(len(key)):
+                for length in (1, 2):
+                    if i + length <= len(key):
+                        self._short.setdefault(key[i:i + length], rank)
+                if i + 3 <= len(key):
+                    self._trigrams.setdefault(key[i:i + 3], set()).add(rank)
+
+    def _first_containing(self, name):
+        """Lowest rank of a key that contains name"""
+        if not name:
+            return 0 if self._keys else None
+        if len(name) < 3:
+            return self._short.get(name)
+
+        postings = []
+        for i in range(len(name) - 2):
+            posting = self._trigrams.get(name[i:i + 3])
+            if not posting:
+                return None
+            postings.append(posting)
+        postings.sort(key=len)
+        for rank in sorted(postings[0].intersection(*postings[1:])):
+            if name in self._keys[rank]:
+                return rank
+        return None
+
+    def partial_match(self, name):
+        ranks = [rank for rank in (self._automaton.first_match(name), self._first_containing(name))
+                 if rank is not None]
+        return self._keys[min(ranks)] if ranks else None
+
+PriceEntry = namedtuple("PriceEntry", ["unit", "price_per_unit", "min_qty", "default_qty"])
+
+class PricingCatalog:
+    """Pricing for every product, consistent across worker processes.
+
+    Entries are keyed by normalized name: the PRODUCT_INFO defaults first,
+    then the pricing fields of every product in MongoDB. Product writes call
+    bump(), which increments a version counter in catalog_meta; each worker
+    checks that counter at most every poll_interval seconds and reloads when
+    it moved, so lookups never hit the database.
+    """
+
+    PRICING_FIELDS = {"name_normalized": 1, "unit": 1, "price_per_unit": 1, "min_qty": 1, "default_qty": 1}
+
+    def __init__(self, products, meta, defaults, poll_interval=5):
+        self._products = products
+        self._meta = meta
+        self._defaults = {key: PriceEntry(info["unit"], info["price_per_unit"], info["min_qty"], info["default_qty"])
+                          for key, info in defaults.items()}
+        self._poll_interval = poll_interval
+        self._entries = None
+        self._version = None
+        self._matcher = None
+        self._next_poll = 0
+        self._listeners = []
+        self._lock = threading.Lock()
+
+    def add_listener(self, callback):
+        """Call callback() whenever a reload picks up another version"""
+        self._listeners.append(callback)
+
+    def _load(self):
+        entries = {}
+        for doc in self._products.find({}, self.PRICING_FIELDS).sort("_id", ASCENDING):
+            key = doc.get("name_normalized")
+            if not key:
+                continue
+            unit = doc.get("unit", "unit")
+            # First product wins, as in ProductIndex, so the price
+            # comes from the same product that is matched and added to the cart
+            entries.setdefault(key, PriceEntry(unit, doc.get("price_per_unit", 1), doc.get("min_qty", 1),
+                                               doc.get("default_qty") or f"1 {unit}"))
+        return {**self._defaults, **entries}
+
+    def _current(self):
+        """Entries for the latest known version, reloading when it changed"""
+        if self._entries is not None and time.time() < self._next_poll:
+            return self._entries
+        with self._lock:
+            if self._entries is None or time.time() >= self._next_poll:
+                try:
+                    version = read_catalog_version(self._meta)
+                    if version != self._version or self._entries is None:
+                        reloaded = self._entries is not None
+                        self._entries = self._load()
+                        self._matcher = None
+                        self._version = version
+                        if reloaded:
+                            for callback in self._listeners:
+                                callback()
+                except Exception as e:
+                    print(f"Error loading pricing catalog: {e}")
+                    if self._entries is None:
+                        self._entries = dict(self._defaults)
+                self._next_poll = time.time() + self._poll_interval
+            return self._entries
+
+    def bump(self):
+        """Record a product write so every worker reloads its pricing"""
+        try:
+            self._meta.update_one({"_id": "pricing"}, {"$inc": {"version": 1}}, upsert=True)
+        except Exception as e:
+            print(f"Error bumping pricing catalog version: {e}")
+        self._next_poll = 0
+
+    def get(self, key):
+        return self._current().get(key)
+
+    def __contains__(self, key):
+        return key in self._current()
+
+    def key_matcher(self):
+        """Partial-match structure over the current keys, built on first use"""
+        self._current()
+        matcher = self._matcher
+        if matcher is None:
+            with self._lock:
+                if self._matcher is None:
+                    self._matcher = ProductKeyMatcher(self._entries.keys())
+                matcher = self._matcher
+        return matcher
+
+pricing_catalog = PricingCatalog(products_col, catalog_meta_col, PRODUCT_INFO)
+pricing_catalog.add_listener(product_index.invalidate)
+pricing_catalog.add_listener(facet_cache.invalidate)
+
 def find_product_key(ingredient_name_norm):
     """Find the product key for an ingredient"""
     # Direct match
-    if ingredient_name_norm in PRODUCT_INFO:
+    if ingredient_name_norm in pricing_catalog:
         return ingredient_name_norm
         
     # Check synonyms
-    for key, synonyms in INGREDIENT_SYNONYMS.items():
-        if ingredient_name_norm == key or ingredient_name_norm in synonyms:
-            return key
+    canonical_keys = SYNONYM_TO_CANONICAL.get(ingredient_name_norm)
+    if canonical_keys:
+        return canonical_keys[0]
             
     # Partial match (e.g., "roma tomato" matches "tomato")
-    for key in PRODUCT_INFO.keys():
-        if key in ingredient_name_norm or ingredient_name_norm in key:
-            return key
-            
-    return None
+    return pricing_catalog.key_matcher().partial_match(ingredient_name_norm)
 
 def parse_quantity(quantity_str):
-    """Parse quantity string into value and unit"""
-    if not quantity_str:
-        return 1, "unit"
-        
-    # Extract numeric value and unit
-    match = re.match(r'([\d.]+)\s*([a-zA-Z]*)', quantity_str)
-    if match:
-        value = float(match.group(1))
-        unit = match.group(2).lower().strip() or "unit"
-        return value, unit
-    else:
-        return 1, "unit"
+    """Parse quantity string into value and canonical unit ("1 1/2 cups" -> (1.5, "cup"))"""
+    return units.parse_quantity(quantity_str)
 
 def calculate_price(product_name, quantity):
     """Calculate price based on product and quantity"""
     try:
         norm_name = normalize_ingredient_name(product_name)
         product_key = find_product_key(norm_name)
+        product_info = pricing_catalog.get(product_key) if product_key else None
         
-        if not product_key or product_key not in PRODUCT_INFO:
-            # Check in database
-            product = products_col.find_one({"name_normalized": norm_name})
-            if product:
-                qty_value, qty_unit = parse_quantity(quantity)
-                return round(qty_value * product.get("price_per_unit", 1), 2)
+        if not product_info:
             return 0.99  # Default price if not found
             
-        product_info = PRODUCT_INFO[product_key]
         qty_value, qty_unit = parse_quantity(quantity)
         
         # Convert units if necessary
-        if qty_unit == "kg" and product_info["unit"] == "gm":
-            qty_value *= 1000
-        elif qty_unit == "gm" and product_info["unit"] == "kg":
-            qty_value /= 1000
-        elif qty_unit == "liter" and product_info["unit"] == "ml":
-            qty_value *= 1000
-        elif qty_unit == "ml" and product_info["unit"] == "liter":
-            qty_value /= 1000
+        qty_value = quantity_in_price_unit(qty_value, qty_unit, product_info, product_key)
             
         # Calculate price
-        return round(qty_value * product_info["price_per_unit"], 2)
+        return round(qty_value * product_info.price_per_unit, 2)
     
     except Exception as e:
         print(f"Error calculating price: {e}")
         return 0.99  # Default price on error
 
+def quantity_in_price_unit(qty_value, qty_unit, product_info, ingredient=None):
+    """Express a quantity in the unit a product is priced in.
+
+    Quantities that can't be converted ("2 medium" of something sold by
+    weight) are priced as the product's default pack, which is also what
+    add_to_cart puts in the cart for them.
+    """
+    converted = units.convert(qty_value, qty_unit, product_info.unit, ingredient)
+    if converted is None:
+        default_value, default_unit = parse_quantity(product_info.default_qty)
+        converted = units.convert(default_value, default_unit, product_info.unit)
+        if converted is None:
+            converted = default_value
+    return converted
+
+def price_many(items):
+    """Price a batch of (product_name, quantity) pairs.
+
+    Each distinct name is normalized and resolved against the pricing
+    catalog once, and each distinct quantity string is parsed once; the
+    conversion and multiplication then run over the whole batch. Results
+    are identical to calling calculate_price on every pair.
+    """
+    # Keyed by type and text, so malformed (even unhashable) values get calculate_price's default
+    items = [(product_name, quantity, (type(product_name), str(product_name)), (type(quantity), str(quantity)))
+             for product_name, quantity in items]
+    entries = {}
+    quantities = {}
+    for product_name, quantity, name_key, quantity_key in items:
+        if name_key not in entries:
+            try:
+                product_key = find_product_key(normalize_ingredient_name(product_name))
+                entries[name_key] = (product_key, pricing_catalog.get(product_key) if product_key else None)
+            except Exception as e:
+                print(f"Error calculating price: {e}")
+                entries[name_key] = (None, None)
+        if quantity_key not in quantities:
+            try:
+                quantities[quantity_key] = parse_quantity(quantity)
+            except Exception as e:
+                print(f"Error calculating price: {e}")
+                quantities[quantity_key] = None
+
+    prices = []
+    for _, _, name_key, quantity_key in items:
+        product_key, product_info = entries[name_key]
+        parsed = quantities[quantity_key]
+        if not product_info or not parsed:
+            prices.append(0.99)
+            continue
+        try:
+            qty_value = quantity_in_price_unit(parsed[0], parsed[1], product_info, product_key)
+            prices.append(round(qty_value * product_info.price_per_unit, 2))
+        except Exception as e:
+            print(f"Error calculating price: {e}")
+            prices.append(0.99)
+    return prices
+
 # --- API endpoints for AJAX calls ---
 
 @app.route("/api/products/search", methods=["GET"])
@@ -1303,28 +3358,26 @@ def api_search_products():
         query = request.args.get("q", "").strip()
         category = request.args.get("category", "")
         
-        db_query = {}
         if query:
-            db_query["$or"] = [
-                {"name": {"$regex": query, "$options": "i"}},
-                {"description": {"$regex": query, "$options": "i"}},
-                {"tags": {"$regex": query, "$options": "i"}}
-            ]
-            
-        if category:
-            db_query["category"] = category
-            
-        products = list(products_col.find(db_query).limit(20))
+            products = product_index.search(query, category, limit=20)
+        else:
+            db_query = {}
+            if category:
+                db_query["category"] = category
+            products = list(products_col.find(db_query).limit(20))
+        
+        prices = price_many((product["name"], product.get("default_qty", f"1 {product.get('unit', 'unit')}"))
+                            for product in products)
         
         # Format for JSON response
         result = []
-        for product in products:
+        for product, price in zip(products, prices):
             result.append({
                 "id": str(product["_id"]),
                 "name": product["name"],
                 "image_url": product["image_url"],
                 "category": product["category"],
-                "price": calculate_price(product["name"], product.get("default_qty", f"1 {product.get('unit', 'unit')}")),
+                "price": price,
                 "unit": product.get("unit", "unit")
             })
             
@@ -1333,6 +3386,39 @@ def api_search_products():
         print(f"Error in API search: {traceback.format_exc()}")
         return jsonify({"success": False, "error": str(e)})
 
+@app.route("/api/products")
+def api_products():
+    """Product cards for the home page grid, one cursor page at a time"""
+    try:
+        per_page = min(max(int(request.args.get("limit", HOME_PAGE_PRODUCTS)), 1), MAX_API_PAGE_SIZE)
+    except ValueError:
+        return jsonify({"success": False, "error": "Invalid limit"}), 400
+
+    try:
+        products, next_token, _ = fetch_product_cards(
+            request.args.get("search", "").strip(),
+            request.args.get("category", ""),
+            request.args.get("cursor"),
+            per_page)
+        default_image = url_for('static', filename='images/default.png')
+
+        result = []
+        for product in products:
+            result.append({
+                "id": str(product["_id"]),
+                "name": product.get("name"),
+                "category": product.get("category"),
+                "price_per_unit": product.get("price_per_unit", 0),
+                "unit": product.get("unit", "unit"),
+                "min_qty": product.get("min_qty", 1),
+                "image_url": product.get("image_url") or default_image
+            })
+
+        return jsonify({"success": True, "products": result, "next_cursor": next_token})
+    except Exception as e:
+        print(f"Error in API products: {traceback.format_exc()}")
+        return jsonify({"success": False, "error": str(e)})
+
 @app.route("/api/order/<order_id>/status", methods=["POST"])
 @login_required
 def api_update_order_status(order_id):
@@ -1345,17 +3431,11 @@ def api_update_order_status(order_id):
         if not status:
             return jsonify({"success": False, "error": "No status provided"})
             
-        valid_statuses = ["pending", "processing", "shipped", "completed", "cancelled"]
-        if status not in valid_statuses:
+        if status not in ORDER_STATUSES:
             return jsonify({"success": False, "error": f"Invalid status '{status}'"})
             
         # Update order
-        result = orders_col.update_one(
-            {"order_id": order_id},
-            {"$set": {"status": status, "last_updated": datetime.now()}}
-        )
-        
-        if result.matched_count == 0:
+        if not set_order_status(order_id, status):
             return jsonify({"success": False, "error": "Order not found"})
             
         return jsonify({
@@ -1368,6 +3448,142 @@ def api_update_order_status(order_id):
         print(f"Error updating order status: {traceback.format_exc()}")
         return jsonify({"success": False, "error": str(e)})
 
+@app.route("/api/recipe_jobs/<job_id>", methods=["GET"])
+def api_recipe_job(job_id):
+    job = recipe_jobs.get(job_id)
+    if not job:
+        return jsonify({"success": False, "error": "Job not found"}), 404
+
+    return jsonify({
+        "success": True,
+        "job_id": job["id"],
+        "status": job["status"],
+        "dish_name": job["dish_name"],
+        "servings": job["servings"],
+        "ingredients": job["ingredients"],
+        "matched_products": job["matched_products"],
+        "error": job["error_message"]
+    })
+
+def sse_event(event, data):
+    """Format one server-sent event"""
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+@app.route("/api/recipe_stream", methods=["GET"])
+def api_recipe_stream():
+    """Stream ingredients and their matched products as server-sent events"""
+    dish_name = request.args.get("dish_name", "").strip()
+    servings = request.args.get("servings", "").strip()
+    dietary_preferences = request.args.getlist("dietary_preferences")
+    default_image_url = url_for('static', filename='images/default.png')
+    user_id = session.get("user_id")
+
+    def generate():
+        if not dish_name or not servings:
+            yield sse_event("error", {"error": "Missing dish name or servings"})
+            return
+        try:
+            servings_count = int(servings)
+            if servings_count <= 0 or servings_count > 20:
+                raise ValueError
+        except ValueError:
+            yield sse_event("error", {"error": "Please enter a number of servings between 1 and 20"})
+            return
+
+        factor = servings_count / BASE_SERVINGS
+        cache_key = RecipeCache.make_key(dish_name, dietary_preferences)
+        cached = recipe_cache.get(cache_key)
+        base_ingredients = []
+        ingredients = []
+        unmatched = []
+
+        try:
+            if cached is not None:
+                # Everything is known up front: match the whole list with one lookup
+                ingredients = scale_ingredients([item for item in map(clean_ingredient, cached) if item], factor)
+                matched, unmatched = match_recipe_products(ingredients, default_image_url)
+                products = {}
+                for product in matched:
+                    products.setdefault(product["ingredient_name"], product)
+                for ingredient in ingredients:
+                    yield sse_event("ingredient", {
+                        "ingredient": ingredient,
+                        "product": products.get(ingredient["name"])
+                    })
+            else:
+                valid = True
+                for base in stream_base_ingredients(dish_name, dietary_preferences):
+                    if base is None:
+                        valid = False
+                        continue
+                    base_ingredients.append(base)
+                    ingredient = scale_ingredients([base], factor)[0]
+                    ingredients.append(ingredient)
+
+                    # Matching is in memory, so one ingredient per event costs no database query
+                    matched, missing = match_recipe_products([ingredient], default_image_url)
+                    unmatched.extend(missing)
+                    yield sse_event("ingredient", {
+                        "ingredient": ingredient,
+                        "product": matched[0] if matched else None
+                    })
+                # Only a clean, complete list is shared with every later request
+                if valid and base_ingredients:
+                    recipe_cache.set(cache_key, base_ingredients)
+        except Exception as e:
+            print(f"Error in recipe stream: {traceback.format_exc()}")
+            yield sse_event("error", {"error": f"Error in recipe generation: {e}"})
+            return
+
+        if not ingredients:
+            yield sse_event("error", {"error": "Unable to generate recipe at this time. Please try again later."})
+            return
+
+        if user_id:
+            record_recipe_suggestion(user_id, dish_name, servings, dietary_preferences,
+                                     ingredients, [], unmatched)
+        yield sse_event("done", {"count": len(ingredients), "unmatched": len(unmatched)})
+
+    return Response(stream_with_context(generate()), mimetype="text/event-stream",
+                    headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+@app.route("/api/admin/cache_stats", methods=["GET"])
+@login_required
+def api_cache_stats():
+    if not session.get("admin"):
+        return jsonify({"success": False, "error": "Permission denied"})
+
+    return jsonify({
+        "success": True,
+        "recipe_cache": recipe_cache.get_stats(),
+        "write_behind": {buffer.name: buffer.get_stats() for buffer in (suggestion_writes, unmatched_writes)}
+    })
+
+ANALYTICS_DEFAULT_RANGE = {"hour": timedelta(hours=48), "day": timedelta(days=30)}
+
+@app.route("/api/admin/analytics", methods=["GET"])
+@login_required
+def api_sales_analytics():
+    if not session.get("admin"):
+        return jsonify({"success": False, "error": "Permission denied"})
+
+    granularity = request.args.get("granularity", "day")
+    if granularity not in SalesRollups.GRANULARITIES:
+        return jsonify({"success": False, "error": f"Invalid granularity '{granularity}'"}), 400
+    try:
+        end = datetime.fromisoformat(request.args["end"]) if request.args.get("end") else datetime.now()
+        start = (datetime.fromisoformat(request.args["start"]) if request.args.get("start")
+                 else end - ANALYTICS_DEFAULT_RANGE[granularity])
+        top = min(max(request.args.get("top", 10, type=int), 1), 50)
+    except ValueError:
+        return jsonify({"success": False, "error": "Invalid date range"}), 400
+
+    try:
+        return jsonify({"success": True, **sales_rollups.summary(granularity, start, end, top)})
+    except Exception as e:
+        print(f"Error reading sales analytics: {traceback.format_exc()}")
+        return jsonify({"success": False, "error": str(e)}), 500
+
 # --- Error handlers ---
 
 @app.errorhandler(404)
@@ -1378,6 +3594,102 @@ def page_not_found(e):
 def server_error(e):
     return render_template('500.html'), 500
 
+# --- Database indexes ---
+
+# Every index the routes rely on: (collection, keys, options)
+REQUIRED_INDEXES = [
+    ("products", [("name_normalized", ASCENDING)], {}),
+    # Keyset pagination walks (name, _id), optionally within one category
+    ("products", [("category", ASCENDING), ("name", ASCENDING), ("_id", ASCENDING)], {}),
+    ("products", [("name", ASCENDING), ("_id", ASCENDING)], {}),
+    ("orders", [("order_id", ASCENDING)], {"unique": True}),
+    ("orders", [("user_id", ASCENDING), ("order_date", DESCENDING)], {}),
+    ("orders", [("status", ASCENDING), ("order_date", DESCENDING), ("_id", DESCENDING)], {}),
+    ("orders", [("order_date", DESCENDING), ("_id", DESCENDING)], {}),
+    ("users", [("username", ASCENDING)], {"unique": True}),
+    ("users", [("email", ASCENDING)], {"unique": True}),
+    ("unmatched_ingredients", [("count", DESCENDING), ("_id", ASCENDING)], {}),
+    ("recipes", [("dietary_tags", ASCENDING)], {}),
+    # Finding the recipes a product change affects
+    ("recipes", [("product_ids", ASCENDING)], {}),
+    ("recipes", [("ingredient_keys", ASCENDING)], {}),
+    # Sweeping expired holds; settled reservations are dropped after a week
+    ("stock_reservations", [("status", ASCENDING), ("expires_at", ASCENDING)], {}),
+    ("stock_reservations", [("settled_at", ASCENDING)], {"expireAfterSeconds": 7 * 24 * 3600}),
+    # Abandoned carts expire a month after their last change
+    ("carts", [("updated_at", ASCENDING)], {"expireAfterSeconds": 30 * 24 * 3600}),
+    # Let MongoDB expire cached recipes on its own
+    ("llm_cache", [("expires_at", ASCENDING)], {"expireAfterSeconds": 0}),
+    ("recipe_jobs", [("expires_at", ASCENDING)], {"expireAfterSeconds": 0}),
+]
+
+# Representative query shapes issued by the routes: (label, collection, filter, sort)
+QUERY_SHAPES = [
+    ("product list by category", "products", {"category": "Vegetables"}, PRODUCT_SORT),
+    ("product list", "products", {}, PRODUCT_SORT),
+    ("product list page", "products",
+     {"$or": [{"name": {"$gt": "Milk"}}, {"name": "Milk", "_id": {"$gt": ObjectId()}}]}, PRODUCT_SORT),
+    ("related products", "products", {"category": "Vegetables", "_id": {"$ne": ObjectId()}}, None),
+    ("view_order", "orders", {"order_id": "00000000-0000-0000-0000-000000000000"}, None),
+    ("dashboard orders", "orders", {"user_id": "000000000000000000000000"}, [("order_date", DESCENDING)]),
+    ("orders by status", "orders", {"status": "pending"}, ORDER_SORT),
+    ("recent orders", "orders", {}, ORDER_SORT),
+    ("login", "users", {"username": "admin"}, None),
+    ("admin login", "users", {"username": "admin", "is_admin": True}, None),
+    ("email check", "users", {"email": "admin@example.com"}, None),
+    ("unmatched ingredients", "unmatched_ingredients", {}, UNMATCHED_SORT),
+    ("expired stock reservations", "stock_reservations",
+     {"status": "held", "expires_at": {"$lt": datetime.now()}}, None),
+    ("recipes by dietary tags", "recipes", {"dietary_tags": {"$all": ["Vegan"]}}, None),
+    ("recipes using a product", "recipes",
+     {"$or": [{"product_ids": ObjectId()}, {"ingredient_keys": {"$in": ["tomato"]}}]}, None),
+    ("related recipes", "recipes", {"_id": {"$ne": ObjectId()}, "dietary_tags": {"$in": ["Vegan"]}}, None),
+]
+
+def ensure_indexes():
+    """Create every declared index; safe to run on every startup"""
+    for collection_name, keys, options in REQUIRED_INDEXES:
+        try:
+            mongo.db[collection_name].create_index(keys, **options)
+        except Exception as e:
+            print(f"Error creating index {keys} on {collection_name}: {e}")
+
+def _plan_stages(plan):
+    """Yield every stage name in an explain() plan tree"""
+    if isinstance(plan, dict):
+        if "stage" in plan:
+            yield plan["stage"]
+        for value in plan.values():
+            yield from _plan_stages(value)
+    elif isinstance(plan, list):
+        for value in plan:
+            yield from _plan_stages(value)
+
+def check_query_plans():
+    """Explain every query shape; returns False if any of them scans a whole collection"""
+    ok = True
+    for label, collection_name, query, sort in QUERY_SHAPES:
+        cursor = mongo.db[collection_name].find(query)
+        if sort:
+            cursor = cursor.sort(sort)
+        winning_plan = cursor.explain().get("queryPlanner", {}).get("winningPlan", {})
+        stages = list(_plan_stages(winning_plan))
+        if "COLLSCAN" in stages:
+            ok = False
+            print(f"COLLSCAN  {label}: {collection_name}.find({query})")
+        else:
+            print(f"ok        {label}: {' <- '.join(stages)}")
+    return ok
+
+def backfill_order_summaries():
+    """Give orders placed before summaries existed their item_count, server-side in one update"""
+    result = orders_col.update_many(
+        {"item_count": {"$exists": False}},
+        [{"$set": {"item_count": {"$size": {"$ifNull": ["$items", []]}}}}]
+    )
+    if result.modified_count:
+        print(f"Backfilled summaries for {result.modified_count} orders")
+
 # --- Initialize database with some data if empty ---
 
 def init_db():
@@ -1399,11 +3711,80 @@ def init_db():
             
             users_col.insert_one(admin_user)
             print("Admin user created with username 'admin' and password 'admin123'")
+
+        ensure_indexes()
+        backfill_order_summaries()
+        migrate_unmatched_suggestions()
+        # Recipes stored before product mappings existed
+        refresh_recipe_products({"products_mapped_at": {"$exists": False}})
             
     except Exception as e:
         print(f"Error initializing database: {e}")
         print(traceback.format_exc())
 
+# --- Recipe product mapping ---
+
+# What a recipe page needs from each product; stored on the recipe as a snapshot
+RECIPE_PRODUCT_FIELDS = ("name", "image_url", "price_per_unit", "unit")
+recipe_mapping_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="recipe-mapping")
+
+def map_recipe_products(ingredients):
+    """The materialized product mapping for a recipe's ingredients.
+
+    products lists, per matched ingredient (by position), the product ID
+    and a snapshot of RECIPE_PRODUCT_FIELDS. product_ids and
+    ingredient_keys (every normalized name and canonical synonym the
+    ingredients could match) are indexed, so a product change can find
+    the recipes it affects.
+    """
+    resolved = resolve_ingredients([ingredient["name"] for ingredient in ingredients], fuzzy=False)
+    ingredient_keys = set()
+    products = []
+    for position, (name_norm, product) in enumerate(resolved):
+        ingredient_keys.update((name_norm, *SYNONYM_TO_CANONICAL.get(name_norm, ())))
+        if product:
+            products.append({"ingredient": position, "product_id": product["_id"],
+                             **{field: product.get(field) for field in RECIPE_PRODUCT_FIELDS}})
+    return {
+        "products": products,
+        "product_ids": sorted({entry["product_id"] for entry in products}),
+        "ingredient_keys": sorted(ingredient_keys),
+        "products_mapped_at": datetime.now()
+    }
+
+def refresh_recipe_products(query, batch_size=200):
+    """Recompute the product mapping of every recipe matching query; returns how many were updated"""
+    updated = 0
+    batch = []
+    for recipe in recipes_col.find(query, {"ingredients.name": 1}):
+        batch.append(UpdateOne({"_id": recipe["_id"]},
+                               {"$set": map_recipe_products(recipe.get("ingredients", []))}))
+        if len(batch) >= batch_size:
+            updated += recipes_col.bulk_write(batch, ordered=False).modified_count
+            batch = []
+    if batch:
+        updated += recipes_col.bulk_write(batch, ordered=False).modified_count
+    return updated
+
+def schedule_recipe_refresh(product_id=None, name_keys=()):
+    """Refresh, in the background, the recipes that use a product or could match one of its names"""
+    conditions = []
+    if product_id:
+        conditions.append({"product_ids": ObjectId(product_id)})
+    name_keys = [key for key in name_keys if key]
+    if name_keys:
+        conditions.append({"ingredient_keys": {"$in": name_keys}})
+    if not conditions:
+        return
+
+    def refresh():
+        try:
+            refresh_recipe_products({"$or": conditions})
+        except Exception:
+            print(f"Error refreshing recipe product mappings: {traceback.format_exc()}")
+
+    recipe_mapping_executor.submit(refresh)
+
 @app.route("/recipes")
 def recipes():
     search_query = request.args.get("search", "")
@@ -1426,16 +3807,11 @@ def recipes():
         if dietary:
             query["dietary_tags"] = {"$all": dietary}
             
-        # Fetch recipes
-        recipes = list(recipes_col.find(query).sort("name", 1))
+        # Fetch recipes; the product mapping is only needed on the detail page
+        recipes = list(recipes_col.find(query, {"products": 0, "product_ids": 0, "ingredient_keys": 0}).sort("name", 1))
         
         # Get all unique dietary preferences for filter
-        dietary_preferences = recipes_col.distinct("dietary_tags")
-        if not dietary_preferences:
-            dietary_preferences = [
-                "Vegetarian", "Vegan", "Gluten-Free", "Dairy-Free",
-                "Keto", "Paleo", "Low-Carb", "Nut-Free"
-            ]
+        dietary_preferences = facet_cache.dietary_tags() or DEFAULT_DIETARY_TAGS
         
     except Exception as e:
         flash(f"Error fetching recipes: {e}", "danger")
@@ -1464,14 +3840,20 @@ def recipe_detail(recipe_id):
             "dietary_tags": {"$in": recipe.get("dietary_tags", [])}
         }).limit(3))
         
-        # Get required products
+        # Required products come from the mapping stored on the recipe
+        recipe_ingredients = recipe.get("ingredients", [])
+        if "products" not in recipe:
+            # Not mapped yet: resolve it now (one batched lookup) and store it
+            mapping = map_recipe_products(recipe_ingredients)
+            recipes_col.update_one({"_id": recipe["_id"]}, {"$set": mapping})
+            recipe.update(mapping)
         required_products = []
-        for ingredient in recipe.get("ingredients", []):
-            product = products_col.find_one({"name_normalized": normalize_ingredient_name(ingredient["name"])})
-            if product:
+        for entry in recipe["products"]:
+            if entry["ingredient"] < len(recipe_ingredients):
                 required_products.append({
-                    "ingredient": ingredient,
-                    "product": product
+                    "ingredient": recipe_ingredients[entry["ingredient"]],
+                    "product": {"_id": entry["product_id"],
+                                **{field: entry.get(field) for field in RECIPE_PRODUCT_FIELDS}}
                 })
         
     except Exception as e:
@@ -1492,6 +3874,10 @@ if __name__ == "__main__":
     # Initialize database
     with app.app_context():
         init_db()
+
+        # python app.py --check-indexes: verify query plans and exit
+        if "--check-indexes" in sys.argv:
+            sys.exit(0 if check_query_plans() else 1)
         
     # Run application
     app.run(debug=True, host="0.0.0.0", port=8000)
\ No newline at end of file
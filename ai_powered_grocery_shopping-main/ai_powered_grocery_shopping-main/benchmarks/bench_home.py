@@ -0,0 +1,112 @@
+"""Home page latency and memory benchmark against catalog size.
+
+Seeds a scratch products collection at several catalog sizes and renders
+GET / through the Flask test client, reporting p50/p95 latency, the peak
+Python allocation of a single render (tracemalloc) and the process RSS.
+For comparison it also times the old behaviour of loading the whole
+catalog sorted by name, which the home page did before it was paginated.
+
+Run from the application directory (needs the app's MongoDB; the scratch
+collection is dropped afterwards):
+
+    python benchmarks/bench_home.py [size ...]
+"""
+import os
+import random
+import resource
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import app as grocery_app  # noqa: E402
+
+CATEGORIES = ["Vegetables", "Fruits", "Dairy", "Grains", "Spices", "Bakery", "Pantry", "Snacks"]
+NOUNS = ["tomato", "onion", "potato", "carrot", "rice", "flour", "milk", "egg", "paneer", "spinach",
+         "garlic", "ginger", "chili", "lentil", "yogurt", "butter", "mango", "banana", "almond", "bread"]
+REQUESTS_PER_SIZE = 50
+
+
+def rss_mb():
+    """Current resident set size; falls back to the peak where /proc isn't available"""
+    try:
+        with open("/proc/self/statm") as statm:
+            return int(statm.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2 ** 20
+    except OSError:
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak / 2 ** 20 if sys.platform == "darwin" else peak / 2 ** 10
+
+
+def make_products(start, count, rng):
+    products = []
+    for i in range(start, start + count):
+        noun = rng.choice(NOUNS)
+        name = f"{noun.title()} {i:07d}"
+        products.append({
+            "name": name,
+            "name_normalized": name.lower(),
+            "category": rng.choice(CATEGORIES),
+            "price_per_unit": round(rng.uniform(10, 500), 2),
+            "unit": rng.choice(["kg", "gm", "ltr", "pcs"]),
+            "min_qty": 1,
+            "image_url": f"/static/images/{noun}.jpg",
+            "tags": [noun, rng.choice(CATEGORIES).lower()],
+            "description": " ".join(rng.choice(NOUNS) for _ in range(40)),
+        })
+    return products
+
+
+def percentile(sorted_values, fraction):
+    return sorted_values[min(len(sorted_values) - 1, int(fraction * len(sorted_values)))]
+
+
+def measure(label, func):
+    latencies = []
+    for _ in range(REQUESTS_PER_SIZE):
+        started = time.perf_counter()
+        func()
+        latencies.append((time.perf_counter() - started) * 1000)
+    latencies.sort()
+
+    tracemalloc.start()
+    func()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    print(f"  {label:24s} p50 {percentile(latencies, 0.50):8.2f} ms  p95 {percentile(latencies, 0.95):8.2f} ms  "
+          f"peak alloc {peak / 2 ** 20:7.2f} MB  rss {rss_mb():7.1f} MB")
+
+
+def main():
+    sizes = [int(arg) for arg in sys.argv[1:]] or [1_000, 10_000, 50_000]
+    rng = random.Random(42)
+
+    collection = grocery_app.mongo.db["bench_home_products"]
+    collection.drop()
+    collection.create_index([("name", 1), ("_id", 1)])
+    collection.create_index([("category", 1), ("name", 1), ("_id", 1)])
+    grocery_app.products_col = collection
+    client = grocery_app.app.test_client()
+
+    def render_home():
+        response = client.get("/")
+        assert response.status_code == 200, response.status_code
+
+    def load_full_catalog():
+        list(collection.find({}).sort("name", 1))
+
+    try:
+        seeded = 0
+        for size in sorted(sizes):
+            collection.insert_many(make_products(seeded, size - seeded, rng))
+            seeded = size
+            print(f"catalog: {size} products")
+            measure("GET / (paginated)", render_home)
+            measure("full catalog query (old)", load_full_catalog)
+    finally:
+        collection.drop()
+
+
+if __name__ == "__main__":
+    main()
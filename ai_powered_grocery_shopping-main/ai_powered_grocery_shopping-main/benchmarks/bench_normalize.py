@@ -0,0 +1,76 @@
+"""Microbenchmark for normalize_ingredient_name.
+
+Compares the original multi-regex implementation with the current
+single-pass version (uncached and memoized) on ingredient names shaped
+like the ones the LLM returns, and checks both give identical output.
+
+Run from the application directory (needs the app's MongoDB to import):
+
+    python benchmarks/bench_normalize.py
+"""
+import itertools
+import os
+import re
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import normalize_ingredient_name  # noqa: E402
+
+
+def legacy_normalize_ingredient_name(name):
+    """The implementation before the single-pass rewrite"""
+    if not name:
+        return ""
+    name = name.lower()
+    for word in ["fresh", "dried", "frozen", "canned", "whole", "sliced", "diced", "chopped", "minced"]:
+        name = re.sub(r'\b' + word + r'\b', '', name)
+    name = re.sub(r'\d+(\.\d+)?\s*(oz|ounce|lb|pound|g|gram|kg|cup|tbsp|tsp|tablespoon|teaspoon)', '', name)
+    name = re.sub(r'\s+', ' ', name).strip()
+    name = re.sub(r'(\w+)ies$', r'\1y', name)
+    name = re.sub(r'(\w+)oes$', r'\1o', name)
+    name = re.sub(r'(\w+[^s])s$', r'\1', name)
+    return name
+
+
+BASE_INGREDIENTS = [
+    "Tomatoes", "Red Onions", "Garlic Cloves", "Ginger", "Basmati Rice", "Olive Oil",
+    "Green Chilies", "Cilantro Leaves", "Potatoes", "Carrots", "Strawberries", "Eggs",
+    "All-Purpose Flour", "Whole Milk", "Butter", "Chicken Breasts", "Cumin Seeds",
+    "Turmeric Powder", "Black Pepper", "Salt", "Lemon Juice", "Paneer Cubes", "Yogurt",
+    "Spinach", "Bell Peppers", "Mushrooms", "Coconut Milk", "Cashews", "Raisins", "Peas",
+]
+PREFIXES = ["", "fresh ", "chopped ", "2 cups ", "1.5 kg ", "3 tbsp finely ", "dried ", "1 fresh oz "]
+SUFFIXES = ["", ", diced", " (canned)", " - minced", ""]
+
+CORPUS = [prefix + name + suffix
+          for prefix, name, suffix in itertools.product(PREFIXES, BASE_INGREDIENTS, SUFFIXES)]
+
+
+def per_call_us(func, number):
+    total = timeit.timeit(lambda: [func(name) for name in CORPUS], number=number)
+    return total / (number * len(CORPUS)) * 1e6
+
+
+def main():
+    mismatches = [name for name in CORPUS
+                  if legacy_normalize_ingredient_name(name) != normalize_ingredient_name.__wrapped__(name)]
+    if mismatches:
+        print(f"{len(mismatches)} names normalize differently, e.g. {mismatches[:3]}")
+        sys.exit(1)
+
+    number = 50
+    legacy = per_call_us(legacy_normalize_ingredient_name, number)
+    single_pass = per_call_us(normalize_ingredient_name.__wrapped__, number)
+    normalize_ingredient_name.cache_clear()
+    memoized = per_call_us(normalize_ingredient_name, number)
+
+    print(f"corpus: {len(CORPUS)} names, {number} rounds")
+    print(f"legacy (13 re.sub calls): {legacy:8.2f} us/call")
+    print(f"single pass, uncached:    {single_pass:8.2f} us/call  ({legacy / single_pass:.1f}x)")
+    print(f"single pass, memoized:    {memoized:8.2f} us/call  ({legacy / memoized:.1f}x)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,98 @@
+"""Search latency benchmark for ProductIndex.search against a synthetic catalog.
+
+Builds the in-memory index over a generated catalog (100k products by
+default) and reports build time plus p50/p95/p99 latency for a mix of
+whole-word, prefix and multi-word queries like the ones the search box
+and /api/products/search send.
+
+Run from the application directory (needs the app's MongoDB to import):
+
+    python benchmarks/bench_search.py [catalog_size]
+"""
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import ProductIndex  # noqa: E402
+
+ADJECTIVES = ["organic", "fresh", "premium", "farm", "local", "baby", "red", "green", "golden",
+              "wild", "smoked", "roasted", "extra", "virgin", "aged", "sweet", "spicy", "mild"]
+NOUNS = ["tomato", "onion", "potato", "carrot", "rice", "flour", "milk", "egg", "paneer", "spinach",
+         "garlic", "ginger", "chili", "pepper", "lentil", "chickpea", "yogurt", "butter", "ghee",
+         "cumin", "turmeric", "coriander", "mango", "banana", "apple", "almond", "cashew", "oat",
+         "bread", "cheese", "basil", "mint", "lemon", "coconut", "mushroom", "peas", "corn", "honey"]
+BRANDS = ["Amul", "Tata", "Aashirvaad", "Fortune", "Everest", "MDH", "Nestle", "Britannia", "Organic Tattva"]
+CATEGORIES = ["Vegetables", "Fruits", "Dairy", "Grains", "Spices", "Bakery", "Pantry", "Snacks"]
+
+
+class ListCollection:
+    """Just enough of a collection for ProductIndex to load from"""
+
+    def __init__(self, documents):
+        self._documents = documents
+
+    def find(self, *args, **kwargs):
+        return iter(self._documents)
+
+
+def make_catalog(size, rng):
+    catalog = []
+    for i in range(size):
+        noun = rng.choice(NOUNS)
+        name = f"{rng.choice(BRANDS)} {rng.choice(ADJECTIVES)} {noun} {rng.randint(1, 999)}"
+        catalog.append({
+            "_id": i,
+            "name": name,
+            "name_normalized": name.lower(),
+            "category": rng.choice(CATEGORIES),
+            "tags": rng.sample(ADJECTIVES, 2) + [noun],
+            "description": " ".join(rng.choice(ADJECTIVES + NOUNS) for _ in range(12)),
+        })
+    return catalog
+
+
+def make_queries(rng, count):
+    queries = []
+    for _ in range(count):
+        kind = rng.random()
+        noun = rng.choice(NOUNS)
+        if kind < 0.4:
+            queries.append(noun)
+        elif kind < 0.7:
+            queries.append(noun[:rng.randint(2, max(2, len(noun) - 1))])
+        else:
+            queries.append(f"{rng.choice(ADJECTIVES)} {noun}")
+    return queries
+
+
+def percentile(sorted_values, fraction):
+    return sorted_values[min(len(sorted_values) - 1, int(fraction * len(sorted_values)))]
+
+
+def main():
+    size = int(sys.argv[1]) if len(sys.argv) > 1 else 100_000
+    rng = random.Random(42)
+
+    index = ProductIndex(ListCollection(make_catalog(size, rng)))
+    started = time.perf_counter()
+    index.search("warmup")
+    print(f"catalog: {size} products, index built in {time.perf_counter() - started:.2f}s")
+
+    for label, category, limit in (("search (limit 20)", None, 20),
+                                   ("search + category", "Dairy", 20),
+                                   ("search (all results)", None, None)):
+        latencies = []
+        for query in make_queries(rng, 500):
+            started = time.perf_counter()
+            index.search(query, category, limit=limit)
+            latencies.append((time.perf_counter() - started) * 1000)
+        latencies.sort()
+        print(f"{label:22s} p50 {percentile(latencies, 0.50):7.2f} ms  "
+              f"p95 {percentile(latencies, 0.95):7.2f} ms  p99 {percentile(latencies, 0.99):7.2f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,247 @@
+"""Concurrent checkout load test for StockLedger: no hot SKU may oversell.
+
+Seeds a scratch products collection with one stock-tracked hot SKU plus
+a few other products, then runs hundreds of checkouts at once from a
+thread pool. Every checkout reserves a few units of the hot SKU (and
+sometimes of the others); most then commit, some release as a failed
+order insert would, and some are abandoned as if the worker died and
+are only released by the expiry sweep.
+
+A second phase drives the same hot SKU through place_order itself,
+against scratch orders and rollup collections. Every checkout is
+submitted twice at once (a double click), and a share of order inserts
+fail on their first attempt, after which the submitter retries with the
+same checkout key, as the re-rendered checkout form does. Units sold are
+counted from the stored orders.
+
+After each phase it checks that:
+
+  * no product's stock_available went below zero,
+  * units sold plus units left equal the starting stock,
+  * nothing is still reserved and no holds are left on any product,
+  * (place_order phase) no checkout key produced more than one order.
+
+Reports reservation latency percentiles and exits non-zero on any
+violation. Run from the application directory (needs the app's MongoDB;
+the scratch collections are dropped afterwards):
+
+    python benchmarks/bench_stock.py [checkouts] [threads]
+"""
+import os
+import random
+import sys
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+from bson.objectid import ObjectId
+from pymongo.errors import AutoReconnect
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import app as grocery_app  # noqa: E402
+from app import CheckoutPendingError, OutOfStockError, SalesRollups, StockLedger  # noqa: E402
+
+HOT_STOCK = 100
+OTHER_STOCK = 1_000
+OTHER_PRODUCTS = 5
+INSERT_FAILURE_RATE = 0.3
+SUBMIT_ATTEMPTS = 3
+
+
+class FlakyOrders:
+    """The scratch orders collection, failing the first insert of some checkout keys"""
+
+    def __init__(self, collection, failure_rate, rng):
+        self._collection = collection
+        self._failing = set()
+        self._failure_rate = failure_rate
+        self._rng = rng
+
+    def fail_first_insert(self, order_ids):
+        self._failing.update(order_id for order_id in order_ids if self._rng.random() < self._failure_rate)
+
+    def insert_one(self, document, *args, **kwargs):
+        try:
+            self._failing.remove(document["order_id"])
+        except KeyError:
+            return self._collection.insert_one(document, *args, **kwargs)
+        raise AutoReconnect("injected order insert failure")
+
+    def __getattr__(self, name):
+        return getattr(self._collection, name)
+
+
+def percentile(sorted_values, fraction):
+    return sorted_values[min(len(sorted_values) - 1, int(fraction * len(sorted_values)))]
+
+
+def check_stock(products, starting, sold):
+    violations = []
+    for doc in products.find({}):
+        available, reserved = doc["stock_available"], doc.get("stock_reserved", 0)
+        if available < 0:
+            violations.append(f"{doc['name']}: stock_available {available} < 0")
+        if available + sold[doc["_id"]] != starting[doc["_id"]]:
+            violations.append(f"{doc['name']}: sold {sold[doc['_id']]} + left {available} "
+                              f"!= started {starting[doc['_id']]}")
+        if reserved or doc.get("stock_holds"):
+            violations.append(f"{doc['name']}: {reserved} still reserved, {len(doc.get('stock_holds', []))} holds")
+    return violations
+
+
+def run_place_order(products, reservations, hot_id, starting, checkouts, threads):
+    """Double-submitted checkouts through place_order, with failing first inserts and retries"""
+    db = grocery_app.mongo.db
+    orders = db["bench_stock_orders"]
+    rollups = db["bench_stock_rollups"]
+    orders.drop()
+    rollups.drop()
+    orders.create_index("order_id", unique=True)
+    products.update_many({}, [{"$set": {"stock_reserved": 0, "stock_holds": []}}])
+    for product_id, stock in starting.items():
+        products.update_one({"_id": product_id}, {"$set": {"stock_available": stock}})
+    reservations.delete_many({})
+
+    rng = random.Random(7)
+    flaky_orders = FlakyOrders(orders, INSERT_FAILURE_RATE, rng)
+    checkout_keys = [str(uuid.uuid4()) for _ in range(checkouts)]
+    flaky_orders.fail_first_insert(checkout_keys)
+    saved = {name: getattr(grocery_app, name) for name in ("orders_col", "stock_ledger", "sales_rollups")}
+    grocery_app.orders_col = flaky_orders
+    grocery_app.stock_ledger = StockLedger(products, reservations, sweep_interval=3600)
+    grocery_app.sales_rollups = SalesRollups(rollups)
+
+    customer = {"customer_name": "Bench", "customer_email": "bench@example.com",
+                "customer_address": "-", "customer_phone": "-"}
+
+    def submit(args):
+        checkout_key, seed = args
+        qty = random.Random(seed).randint(1, 3)
+        cart = [{"id": str(uuid.uuid4()), "product_name": "Hot SKU", "ingredient_name": "hot sku",
+                 "quantity": f"{qty} unit", "unit": "unit", "min_qty": 1, "image_url": "",
+                 "product_id": str(hot_id)}]
+        for _ in range(SUBMIT_ATTEMPTS):
+            try:
+                _, created = grocery_app.place_order(checkout_key, cart, customer)
+                return "created" if created else "duplicate"
+            except OutOfStockError:
+                return "out_of_stock"
+            except (AutoReconnect, CheckoutPendingError):
+                continue  # the form comes back with the same checkout key
+        return "gave_up"
+
+    try:
+        started = time.perf_counter()
+        # Each key is submitted twice at once
+        jobs = [(key, i) for i, key in enumerate(checkout_keys) for _ in range(2)]
+        with ThreadPoolExecutor(max_workers=threads) as pool:
+            results = list(pool.map(submit, jobs))
+        wall = time.perf_counter() - started
+        # Let the post-order tasks finish against the scratch collections; the process exits afterwards
+        grocery_app.post_order_executor.shutdown(wait=True)
+
+        outcomes = {}
+        for outcome in results:
+            outcomes[outcome] = outcomes.get(outcome, 0) + 1
+        sold = {oid: 0 for oid in starting}
+        orders_per_key = {}
+        for order in orders.find({}, {"order_id": 1, "items.product_id": 1, "items.quantity_value": 1}):
+            orders_per_key[order["order_id"]] = orders_per_key.get(order["order_id"], 0) + 1
+            for item in order["items"]:
+                sold[ObjectId(item["product_id"])] += item["quantity_value"]
+
+        print(f"place_order: {len(jobs)} submits of {checkouts} checkouts on {threads} threads in {wall:.2f} s")
+        print("  " + "  ".join(f"{name} {count}" for name, count in sorted(outcomes.items())))
+        print(f"  hot SKU: {sum(orders_per_key.values())} orders, sold {sold[hot_id]:g} of {HOT_STOCK}")
+
+        violations = check_stock(products, starting, sold)
+        violations += [f"checkout {key}: {count} orders" for key, count in orders_per_key.items() if count > 1]
+        return violations
+    finally:
+        for name, value in saved.items():
+            setattr(grocery_app, name, value)
+        orders.drop()
+        rollups.drop()
+
+
+def main():
+    checkouts = int(sys.argv[1]) if len(sys.argv) > 1 else 500
+    threads = int(sys.argv[2]) if len(sys.argv) > 2 else 200
+
+    products = grocery_app.mongo.db["bench_stock_products"]
+    reservations = grocery_app.mongo.db["bench_stock_reservations"]
+    products.drop()
+    reservations.drop()
+    reservations.create_index([("status", 1), ("expires_at", 1)])
+
+    hot_id = products.insert_one({"name": "Hot SKU", "stock_available": HOT_STOCK, "stock_reserved": 0}).inserted_id
+    other_ids = products.insert_many([
+        {"name": f"Other {i}", "stock_available": OTHER_STOCK, "stock_reserved": 0} for i in range(OTHER_PRODUCTS)
+    ]).inserted_ids
+    starting = {hot_id: HOT_STOCK, **{oid: OTHER_STOCK for oid in other_ids}}
+
+    ledger = StockLedger(products, reservations, sweep_interval=3600)
+
+    def checkout(seed):
+        rng = random.Random(seed)
+        lines = [(str(hot_id), rng.randint(1, 3))]
+        if rng.random() < 0.5:
+            lines.append((str(rng.choice(other_ids)), rng.randint(1, 5)))
+        reservation_id = str(uuid.uuid4())
+        started = time.perf_counter()
+        try:
+            ledger.reserve(reservation_id, lines)
+        except OutOfStockError:
+            return "out_of_stock", lines, (time.perf_counter() - started) * 1000
+        elapsed = (time.perf_counter() - started) * 1000
+        outcome = rng.random()
+        if outcome < 0.8:
+            ledger.commit(reservation_id)
+            return "committed", lines, elapsed
+        if outcome < 0.9:
+            ledger.release(reservation_id)
+            return "released", lines, elapsed
+        return "abandoned", lines, elapsed
+
+    try:
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=threads) as pool:
+            results = list(pool.map(checkout, range(checkouts)))
+        wall = time.perf_counter() - started
+        # Let the abandoned reservations expire; the sweep gives their stock back
+        reservations.update_many({"status": "held"}, {"$set": {"expires_at": datetime.now() - timedelta(seconds=1)}})
+        swept = ledger.release_expired()
+
+        sold = {oid: 0 for oid in starting}
+        outcomes = {}
+        for outcome, lines, _ in results:
+            outcomes[outcome] = outcomes.get(outcome, 0) + 1
+            if outcome == "committed":
+                for product_id, qty in lines:
+                    sold[ObjectId(product_id)] += qty
+
+        latencies = sorted(elapsed for _, _, elapsed in results)
+        print(f"{checkouts} checkouts on {threads} threads in {wall:.2f} s; swept {swept} abandoned")
+        print("  " + "  ".join(f"{name} {count}" for name, count in sorted(outcomes.items())))
+        print(f"  reserve p50 {percentile(latencies, 0.50):.2f} ms  p95 {percentile(latencies, 0.95):.2f} ms  "
+              f"p99 {percentile(latencies, 0.99):.2f} ms")
+
+        violations = check_stock(products, starting, sold)
+        print(f"  hot SKU: sold {sold[hot_id]} of {HOT_STOCK}")
+
+        violations += run_place_order(products, reservations, hot_id, starting, checkouts, threads)
+
+        for violation in violations:
+            print(f"VIOLATION {violation}")
+        if violations:
+            sys.exit(1)
+        print("ok: no oversell")
+    finally:
+        products.drop()
+        reservations.drop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,93 @@
+"""Parse + convert throughput benchmark for units.py.
+
+Runs a mix of recipe-style quantities ("1 1/2 cups", "500g", "2 medium",
+"½ tsp", "2-3 cloves") through units.parse_quantity and units.convert,
+with the parse cache cleared (cold) and warm, and reports operations per
+second next to the regex and if-chain the app used before, which only
+understood gm/kg and ml/liter.
+
+Does not need MongoDB:
+
+    python benchmarks/bench_units.py [iterations]
+"""
+import os
+import random
+import re
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import units  # noqa: E402
+
+AMOUNTS = ["1", "2", "250", "1.5", ".5", "1/2", "3/4", "1 1/2", "2 1/4", "½", "1½", "2-3"]
+UNIT_WORDS = ["g", "gm", "grams", "kg", "ml", "liter", "litre", "cup", "cups", "tbsp", "tablespoons", "tsp",
+              "oz", "lb", "medium", "cloves", "pieces", "bunch", "fl oz", ""]
+TARGETS = [("gm", "flour"), ("kg", "rice"), ("ml", "milk"), ("liter", "oil"), ("unit", "egg"), ("bunch", "coriander")]
+
+LEGACY_QUANTITY_RE = re.compile(r'([\d.]+)\s*([a-zA-Z]*)')
+
+
+def legacy_parse_and_convert(quantity, price_unit):
+    """The pre-units.py parse_quantity plus calculate_price's conversion chain"""
+    match = LEGACY_QUANTITY_RE.match(quantity)
+    if match:
+        value = float(match.group(1))
+        unit = match.group(2).lower().strip() or "unit"
+    else:
+        value, unit = 1, "unit"
+    if unit == "kg" and price_unit == "gm":
+        value *= 1000
+    elif unit == "gm" and price_unit == "kg":
+        value /= 1000
+    elif unit == "liter" and price_unit == "ml":
+        value *= 1000
+    elif unit == "ml" and price_unit == "liter":
+        value /= 1000
+    return value
+
+
+def parse_and_convert(quantity, price_unit, ingredient):
+    value, unit = units.parse_quantity(quantity)
+    return units.convert(value, unit, price_unit, ingredient)
+
+
+def make_workload(rng, size):
+    workload = []
+    for _ in range(size):
+        quantity = f"{rng.choice(AMOUNTS)} {rng.choice(UNIT_WORDS)}".strip()
+        price_unit, ingredient = rng.choice(TARGETS)
+        workload.append((quantity, price_unit, ingredient))
+    return workload
+
+
+def run(label, func, workload, before=None):
+    if before:
+        before()
+    started = time.perf_counter()
+    for quantity, price_unit, ingredient in workload:
+        func(quantity, price_unit, ingredient)
+    elapsed = time.perf_counter() - started
+    print(f"{label:28s} {len(workload) / elapsed / 1000:8.0f}k ops/s  ({elapsed / len(workload) * 1e6:.2f} us/op)")
+
+
+def main():
+    iterations = int(sys.argv[1]) if len(sys.argv) > 1 else 200_000
+    rng = random.Random(42)
+    # Mostly repeated strings, like real carts and recipes, plus a unique tail
+    workload = make_workload(rng, iterations)
+
+    understood = sum(parse_and_convert(*item) is not None for item in workload)
+    print(f"{iterations} quantities, {understood / iterations:.0%} convertible to the product's unit")
+
+    run("legacy regex + if-chain", lambda q, u, i: legacy_parse_and_convert(q, u), workload)
+    run("units (cold parse cache)", parse_and_convert, workload, before=units.parse_quantity.cache_clear)
+    run("units (warm parse cache)", parse_and_convert, workload)
+
+    unique = [(f"{n} {rng.choice(UNIT_WORDS)}", u, i) for n, (u, i) in
+              ((rng.randint(1, 10 ** 6), rng.choice(TARGETS)) for _ in range(iterations))]
+    run("units (all unique strings)", parse_and_convert, unique, before=units.parse_quantity.cache_clear)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,6 +1,7 @@
 from g4f.client import Client
 import gradio as gr
 import re
+from units import AMOUNT_PATTERN, parse_amount
 
 # Initialize GPT client
 client = Client()
@@ -41,12 +42,14 @@ Keep it simple and consistent.
                 quantity = quantity.strip()
 
                 # Try to extract numeric value to scale
-                match = re.match(r"([\d\.\/]+)\s*(.*)", quantity)
+                match = re.match(rf"({AMOUNT_PATTERN})\s*(.*)", quantity)
                 if match:
                     amount_str, unit = match.groups()
-                    # Convert fractions to float
+                    # Convert fractions and mixed numbers to float
                     try:
-                        amount = eval(amount_str)
+                        amount = parse_amount(amount_str)
+                        if amount is None:
+                            raise ValueError(f"not an amount: {amount_str}")
                         scaled_amount = round(amount * scale_factor, 2)
                         scaled_quantity = f"{scaled_amount} {unit}".strip()
                     except:
@@ -0,0 +1,45 @@
+import pytest
+
+pytest.importorskip("flask")
+pytest.importorskip("flask_pymongo")
+
+from app import MemoryCartStore  # noqa: E402
+
+
+def item(item_id, quantity, price):
+    return {"id": item_id, "product_name": "Potato", "product_id": None, "quantity": quantity, "price": price}
+
+
+def merge_same_unit(existing, new):
+    """Adds quantities like "500 gm" only when both lines use the same unit"""
+    (amount, unit), (new_amount, new_unit) = existing["quantity"].split(), new["quantity"].split()
+    if unit != new_unit:
+        return None
+    return {"quantity": f"{float(amount) + float(new_amount)} {unit}", "price": existing["price"] + new["price"]}
+
+
+def test_incompatible_add_keeps_mapping_through_remove():
+    store = MemoryCartStore()
+    assert store.add_or_merge("cart", item("a", "500 gm", 1.0), merge_same_unit) is None
+    assert store.add_or_merge("cart", item("b", "2 medium", 0.5), merge_same_unit) is None
+    assert store.count("cart") == 2
+
+    # Removing the first line leaves the second one as the product's line
+    assert store.remove_item("cart", "a")
+    merged = store.add_or_merge("cart", item("c", "1 medium", 0.25), merge_same_unit)
+
+    assert merged["id"] == "b"
+    items, total = store.get("cart")
+    assert [(line["id"], line["quantity"]) for line in items] == [("b", "3.0 medium")]
+    assert total == 0.75
+
+
+def test_removing_mapped_line_lets_next_add_start_a_new_line():
+    store = MemoryCartStore()
+    store.add_or_merge("cart", item("a", "500 gm", 1.0), merge_same_unit)
+    store.add_or_merge("cart", item("b", "2 medium", 0.5), merge_same_unit)
+
+    assert store.remove_item("cart", "a")
+    assert store.remove_item("cart", "b")
+    assert store.add_or_merge("cart", item("c", "1 medium", 0.25), merge_same_unit) is None
+    assert store.count("cart") == 1
@@ -0,0 +1,16 @@
+import pytest
+
+pytest.importorskip("flask")
+pytest.importorskip("flask_pymongo")
+
+from app import calculate_price, price_many  # noqa: E402
+
+
+def test_price_many_matches_calculate_price():
+    items = [("tomato", "2 kg"), ("tomato", "500 g"), ("no such product", "1 unit"), ("tomato", "2 kg")]
+    assert price_many(items) == [calculate_price(name, quantity) for name, quantity in items]
+
+
+def test_price_many_prices_unhashable_values_like_calculate_price():
+    items = [("tomato", ["2", "kg"]), (["tomato"], "2 kg"), ("tomato", {"amount": 2})]
+    assert price_many(items) == [calculate_price(name, quantity) for name, quantity in items]
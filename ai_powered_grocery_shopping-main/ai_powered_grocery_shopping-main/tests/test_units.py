@@ -0,0 +1,18 @@
+import units
+
+
+def test_parse_amount():
+    assert units.parse_amount("2") == 2.0
+    assert units.parse_amount("1 1/2") == 1.5
+    assert units.parse_amount("½") == 0.5
+
+
+def test_parse_amount_zero_denominator_is_not_an_amount():
+    assert units.parse_amount("1/0") is None
+    assert units.parse_amount("1 1/0") is None
+
+
+def test_parse_quantity_zero_denominator_is_one_default_unit():
+    assert units.parse_quantity("1/0 cup") == (1.0, "unit")
+    assert units.parse_quantity("2-1/0 kg") == (1.0, "unit")
+    assert units.parse_quantity("1/2 cup") == (0.5, "cup")
@@ -0,0 +1,212 @@
+# -*- coding: utf-8 -*-
+"""Quantity parsing and unit conversion for ingredients and products.
+
+Every known unit belongs to a dimension (mass, volume, count or bunch) and
+has a size in that dimension's base unit (gm, ml, unit). The conversion
+table between every pair of units in a dimension is built once at import,
+so converting is a dictionary lookup. Volume and mass can be bridged for
+common ingredients through DENSITY_HINTS (grams per ml).
+"""
+import re
+from functools import lru_cache
+
+# Canonical unit -> (dimension, size in the dimension's base unit)
+UNITS = {
+    # Mass, base gm
+    "mg": ("mass", 0.001),
+    "gm": ("mass", 1),
+    "kg": ("mass", 1000),
+    "oz": ("mass", 28.349523125),
+    "lb": ("mass", 453.59237),
+    # Volume, base ml
+    "ml": ("volume", 1),
+    "liter": ("volume", 1000),
+    "tsp": ("volume", 4.92892159375),
+    "tbsp": ("volume", 14.78676478125),
+    "fl oz": ("volume", 29.5735295625),
+    "cup": ("volume", 236.5882365),
+    "pint": ("volume", 473.176473),
+    "quart": ("volume", 946.352946),
+    "gallon": ("volume", 3785.411784),
+    # Count, base unit
+    "unit": ("count", 1),
+    "pair": ("count", 2),
+    "dozen": ("count", 12),
+    "bunch": ("bunch", 1),
+}
+
+# Spellings seen in recipes and product data -> canonical unit
+UNIT_ALIASES = {
+    "milligram": "mg", "milligrams": "mg", "mgs": "mg",
+    "g": "gm", "gms": "gm", "gr": "gm", "grm": "gm", "gram": "gm", "grams": "gm", "gramme": "gm", "grammes": "gm",
+    "kgs": "kg", "kilo": "kg", "kilos": "kg", "kilogram": "kg", "kilograms": "kg",
+    "ounce": "oz", "ounces": "oz",
+    "lbs": "lb", "pound": "lb", "pounds": "lb",
+    "milliliter": "ml", "milliliters": "ml", "millilitre": "ml", "millilitres": "ml", "mls": "ml",
+    "l": "liter", "ltr": "liter", "ltrs": "liter", "liters": "liter", "litre": "liter", "litres": "liter",
+    "teaspoon": "tsp", "teaspoons": "tsp", "tsps": "tsp",
+    "tablespoon": "tbsp", "tablespoons": "tbsp", "tbsps": "tbsp", "tbs": "tbsp", "tbl": "tbsp",
+    "floz": "fl oz", "fl. oz": "fl oz", "fluid ounce": "fl oz", "fluid ounces": "fl oz",
+    "cups": "cup", "c": "cup",
+    "pints": "pint", "pt": "pint",
+    "quarts": "quart", "qt": "quart",
+    "gallons": "gallon", "gal": "gallon",
+    "units": "unit", "piece": "unit", "pieces": "unit", "pc": "unit", "pcs": "unit", "nos": "unit",
+    "no": "unit", "each": "unit", "whole": "unit", "small": "unit", "medium": "unit", "large": "unit",
+    "clove": "unit", "cloves": "unit", "slice": "unit", "slices": "unit",
+    "pairs": "pair", "dozens": "dozen", "doz": "dozen",
+    "bunches": "bunch",
+}
+
+# Approximate grams per ml, for converting cups and spoons of common ingredients to weight
+DENSITY_HINTS = {
+    "water": 1.0,
+    "milk": 1.03,
+    "cream": 1.01,
+    "yogurt": 1.03,
+    "curd": 1.03,
+    "oil": 0.92,
+    "ghee": 0.91,
+    "butter": 0.91,
+    "honey": 1.42,
+    "flour": 0.53,
+    "maida": 0.53,
+    "atta": 0.51,
+    "sugar": 0.85,
+    "salt": 1.2,
+    "rice": 0.85,
+    "lentil": 0.82,
+    "dal": 0.82,
+    "oat": 0.41,
+    "cocoa": 0.42,
+    "tomato": 0.95,
+    "onion": 0.6,
+    "carrot": 0.54,
+    "potato": 0.65,
+    "cheese": 0.45,
+    "paneer": 0.6,
+}
+
+
+def _build_conversions(units):
+    """(from, to) -> (multiplier, divisor) for every pair of units in the same dimension.
+
+    Converting is value * multiplier / divisor, so gm -> kg divides by 1000
+    exactly instead of multiplying by an inexact 0.001.
+    """
+    conversions = {}
+    for source, (source_dimension, source_size) in units.items():
+        for target, (target_dimension, target_size) in units.items():
+            if source != target and source_dimension == target_dimension:
+                conversions[(source, target)] = (source_size, target_size)
+    return conversions
+
+
+CONVERSIONS = _build_conversions(UNITS)
+
+UNICODE_FRACTIONS = {
+    "½": 1 / 2, "⅓": 1 / 3, "⅔": 2 / 3, "¼": 1 / 4, "¾": 3 / 4, "⅕": 1 / 5, "⅖": 2 / 5, "⅗": 3 / 5,
+    "⅘": 4 / 5, "⅙": 1 / 6, "⅚": 5 / 6, "⅛": 1 / 8, "⅜": 3 / 8, "⅝": 5 / 8, "⅞": 7 / 8,
+}
+_VULGAR = "[" + "".join(UNICODE_FRACTIONS) + "]"
+
+# An amount: "1 1/2", "1½", "1/2", "1.5", ".5", "2" or "½"
+AMOUNT_PATTERN = (rf'\d+\s+\d+/\d+|\d+\s*{_VULGAR}|\d+/\d+|\d*\.\d+|\d+|{_VULGAR}')
+
+# Leading amount (or range "2-3"), then an optional unit word
+QUANTITY_RE = re.compile(
+    rf'\s*({AMOUNT_PATTERN})(?:\s*(?:-|to)\s*({AMOUNT_PATTERN}))?'
+    r'\s*(fl\.?\s*oz|fluid ounces?|[^\W\d_]+)?',
+    re.IGNORECASE,
+)
+
+
+def parse_amount(text):
+    """Convert "2", "1.5", ".5", "1/2", "1 1/2", "1½" or "½" to a float; None if it isn't an amount"""
+    total = 0.0
+    try:
+        for part in text.split():
+            if part[-1] in UNICODE_FRACTIONS:
+                whole = part[:-1]
+                total += (float(whole) if whole else 0.0) + UNICODE_FRACTIONS[part[-1]]
+            elif "/" in part:
+                numerator, denominator = part.split("/")
+                if float(denominator) == 0:
+                    return None
+                total += float(numerator) / float(denominator)
+            else:
+                total += float(part)
+    except ValueError:
+        return None
+    return total
+
+
+def canonical_unit(unit):
+    """Canonical name of a unit ("Grams" -> "gm"); unknown units come back lowercased"""
+    if unit in UNITS:
+        return unit
+    unit = " ".join(unit.lower().split()) if unit else "unit"
+    return UNIT_ALIASES.get(unit, unit)
+
+
+@lru_cache(maxsize=4096)
+def parse_quantity(text, default_unit="unit"):
+    """Split a quantity string into (value, canonical unit).
+
+    "1 1/2 cups" -> (1.5, "cup"), "500g" -> (500.0, "gm"). A range counts as
+    its upper bound so there is enough to cook with. Strings without a
+    leading amount ("to taste") or with an unusable one ("1/0 cup") are one
+    default_unit.
+    """
+    if not text:
+        return 1.0, default_unit
+    match = QUANTITY_RE.match(text)
+    if not match:
+        return 1.0, default_unit
+    low, high, unit = match.groups()
+    value = parse_amount(high or low)
+    if value is None:
+        return 1.0, default_unit
+    return value, canonical_unit(unit) if unit else default_unit
+
+
+def density_for(ingredient):
+    """Grams per ml for an ingredient name, trying the whole name then each word"""
+    if not ingredient:
+        return None
+    density = DENSITY_HINTS.get(ingredient)
+    if density is None:
+        for word in reversed(ingredient.split()):
+            density = DENSITY_HINTS.get(word)
+            if density is not None:
+                break
+    return density
+
+
+def convert(value, from_unit, to_unit, ingredient=None):
+    """Convert value between units; None when the units aren't compatible.
+
+    Mass and volume convert into each other only when ingredient has a
+    density hint.
+    """
+    source = canonical_unit(from_unit)
+    target = canonical_unit(to_unit)
+    if source == target:
+        return value
+
+    rate = CONVERSIONS.get((source, target))
+    if rate:
+        return value * rate[0] / rate[1]
+
+    source_entry = UNITS.get(source)
+    target_entry = UNITS.get(target)
+    if not source_entry or not target_entry:
+        return None
+    density = density_for(ingredient)
+    if density is None:
+        return None
+    if source_entry[0] == "volume" and target_entry[0] == "mass":
+        return value * source_entry[1] * density / target_entry[1]
+    if source_entry[0] == "mass" and target_entry[0] == "volume":
+        return value * source_entry[1] / density / target_entry[1]
+    return None